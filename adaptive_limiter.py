@@ -0,0 +1,141 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+# Slot outcomes reported back to the limiter
+OK = 'ok'
+THROTTLED = 'throttled'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+
+class _Slot:
+    """One in-flight request; set outcome to report 429s/timeouts"""
+
+    def __init__(self):
+        self.outcome = OK
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter driven by latency and throttling feedback.
+
+    The limit grows by roughly one slot per round trip while latency stays
+    close to the observed baseline, and is cut multiplicatively on 429s,
+    timeouts or latency spikes.
+    """
+
+    def __init__(self, name: str, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 32,
+                 latency_tolerance: float = 2.0, backoff: float = 0.5, smoothing: float = 0.2):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.baseline_latency = None
+        self.last_decrease = 0.0
+
+        self.completed = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.decreases = 0
+
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """Block until a slot is free; returns the start time"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, outcome: str = OK):
+        """Free a slot and adjust the limit from its latency and outcome"""
+        latency = time.monotonic() - started
+
+        with self._condition:
+            self.in_flight -= 1
+
+            if outcome == THROTTLED:
+                self.throttled += 1
+                self._decrease()
+            elif outcome == TIMEOUT:
+                self.timeouts += 1
+                self._decrease()
+            elif outcome == ERROR:
+                # Not a capacity signal (bad request, parsing error, ...)
+                self.errors += 1
+            else:
+                self.completed += 1
+                self._observe_latency(latency)
+
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of a request"""
+        slot = _Slot()
+        started = self.acquire()
+        try:
+            yield slot
+        except BaseException:
+            if slot.outcome == OK:
+                slot.outcome = ERROR
+            raise
+        finally:
+            self.release(started, slot.outcome)
+
+    def _observe_latency(self, latency: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+            self.baseline_latency = latency
+        else:
+            self.latency_ewma += self.smoothing * (latency - self.latency_ewma)
+
+        if self.latency_ewma < self.baseline_latency:
+            self.baseline_latency = self.latency_ewma
+        else:
+            # Let the baseline drift up slowly so a permanently slower upstream
+            # is not treated as a spike forever
+            self.baseline_latency += 0.01 * (self.latency_ewma - self.baseline_latency)
+
+        if latency > self.baseline_latency * self.latency_tolerance:
+            self._decrease()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self):
+        # Only back off once per round trip; requests already in flight when
+        # we backed off report the same congestion
+        now = time.monotonic()
+        if now - self.last_decrease < (self.baseline_latency or 0.0):
+            return
+
+        self.last_decrease = now
+        self.decreases += 1
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def stats(self) -> Dict:
+        """Current limit and counters for observability"""
+        with self._condition:
+            return {
+                'name': self.name,
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'latency_ewma': self.latency_ewma,
+                'baseline_latency': self.baseline_latency,
+                'completed': self.completed,
+                'throttled': self.throttled,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'decreases': self.decreases
+            }
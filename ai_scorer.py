@@ -1,11 +1,125 @@
 import openai
-from typing import Dict, List
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from config import OPENAI_API_KEY
+from adaptive_limiter import AdaptiveLimiter, THROTTLED, TIMEOUT
+from lead_dedup import LeadDeduplicator
+from resilience import CircuitBreaker, CircuitOpenError, HedgedCaller
+from profiling import propagate
+
+SCORING_INSTRUCTIONS = """
+You are an expert sales lead scorer. Analyze the following lead information and provide a score from 1-10 based on lead quality, potential value, and likelihood to convert.
+
+Scoring criteria:
+- 1-3: Low quality lead (poor contact info, no clear value, unlikely to convert)
+- 4-6: Medium quality lead (decent contact info, some potential, moderate conversion chance)
+- 7-8: High quality lead (good contact info, clear value proposition, likely to convert)
+- 9-10: Excellent lead (complete info, high value, very likely to convert)
+
+Consider these factors:
+- Contact information completeness (phone, email)
+- Company size and position
+- Lead source and pipeline stage
+- Custom field data
+- Price/value indicators
+- Tags and previous interactions
+"""
+
+# Rate limiting and failure handling follow the OpenAI key, not the scorer:
+# accounts that share a key share one limiter, hedger and circuit breaker
+_upstream_controls = {}
+_upstream_controls_lock = threading.Lock()
+
+
+def _controls_for_key(api_key: str) -> tuple:
+    """(limiter, hedger, breaker) shared by every scorer using api_key"""
+    with _upstream_controls_lock:
+        if api_key not in _upstream_controls:
+            limiter = AdaptiveLimiter('openai', initial_limit=4, max_limit=32)
+            # Slow calls are hedged after the p95 latency; repeated failures open the circuit
+            hedger = HedgedCaller('openai', max_workers=2 * limiter.max_limit)
+            breaker = CircuitBreaker('openai')
+            _upstream_controls[api_key] = {'controls': (limiter, hedger, breaker), 'users': 0}
+        entry = _upstream_controls[api_key]
+        entry['users'] += 1
+        return entry['controls']
+
+def _release_controls(api_key: str):
+    """Drop one user of a key's controls; the last one stops the hedging threads"""
+    with _upstream_controls_lock:
+        entry = _upstream_controls.get(api_key)
+        if entry is None:
+            return
+        entry['users'] -= 1
+        if entry['users'] <= 0:
+            entry['controls'][1].close()
+            del _upstream_controls[api_key]
+
+def _is_upstream_failure(error: Exception) -> bool:
+    """Errors that mean OpenAI itself is failing: connection errors, timeouts and 5xx"""
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
 
 class AILeadScorer:
-    def __init__(self):
-        openai.api_key = OPENAI_API_KEY
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, dedupe_threshold: Optional[float] = None, api_key: Optional[str] = None):
+        api_key = api_key or OPENAI_API_KEY
+        self.client = openai.OpenAI(api_key=api_key)
+        self._api_key = api_key
+        # Only accounts with their own OpenAI key get a separate rate-limit bucket
+        self.limiter, self.hedger, self.breaker = _controls_for_key(api_key)
+        # Leads that could not be scored because OpenAI was failing, by lead id
+        self.parked_leads = {}
+        self._parked_lock = threading.Lock()
+        # Similarity above which leads share one AI score (None disables clustering)
+        self.dedupe_threshold = dedupe_threshold
+        # Cumulative token usage, read by the budgeted scheduler
+        self.usage = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self._usage_lock = threading.Lock()
+        # Reasons generated on demand, by (lead id, updated_at, score)
+        self.reason_cache = {}
+    
+    def _record_usage(self, response):
+        usage = getattr(response, 'usage', None)
+        with self._usage_lock:
+            self.usage['requests'] += 1
+            if usage:
+                self.usage['prompt_tokens'] += usage.prompt_tokens or 0
+                self.usage['completion_tokens'] += usage.completion_tokens or 0
+    
+    def get_usage(self) -> Dict:
+        """Snapshot of cumulative token usage"""
+        with self._usage_lock:
+            return dict(self.usage)
+    
+    def close(self):
+        """Release the HTTP client and this scorer's share of the hedging threads"""
+        if self._api_key is None:
+            return
+        _release_controls(self._api_key)
+        self._api_key = None
+        self.client.close()
+    
+    def get_resilience_stats(self) -> Dict:
+        """Hedging and circuit breaker counters"""
+        stats = self.hedger.stats()
+        stats['breaker'] = self.breaker.stats()
+        stats['parked_leads'] = len(self.parked_leads)
+        return stats
+    
+    def park_lead(self, lead: Dict):
+        """Keep a lead for a later retry instead of giving it a default score"""
+        with self._parked_lock:
+            self.parked_leads[lead.get('id')] = lead
+    
+    def take_parked_leads(self) -> List[Dict]:
+        """Return and clear the parked leads"""
+        with self._parked_lock:
+            leads = list(self.parked_leads.values())
+            self.parked_leads = {}
+        return leads
     
     def extract_lead_data(self, lead: Dict) -> str:
         """Extract relevant data from a lead for AI analysis"""
@@ -63,27 +177,73 @@ Custom Fields:
 """
         return lead_summary
     
-    def score_lead(self, lead: Dict) -> tuple:
-        """Score a lead from 1-10 using AI and return score with reason"""
-        lead_data = self.extract_lead_data(lead)
-        
-        prompt = f"""
-You are an expert sales lead scorer. Analyze the following lead information and provide a score from 1-10 based on lead quality, potential value, and likelihood to convert.
-
-Scoring criteria:
-- 1-3: Low quality lead (poor contact info, no clear value, unlikely to convert)
-- 4-6: Medium quality lead (decent contact info, some potential, moderate conversion chance)
-- 7-8: High quality lead (good contact info, clear value proposition, likely to convert)
-- 9-10: Excellent lead (complete info, high value, very likely to convert)
+    def _complete(self, system: str, prompt: str, max_tokens: int, stop: Optional[List[str]] = None) -> str:
+        """Run one chat completion (hedged, inside the adaptive limiter) and return its text.
 
-Consider these factors:
-- Contact information completeness (phone, email)
-- Company size and position
-- Lead source and pipeline stage
-- Custom field data
-- Price/value indicators
-- Tags and previous interactions
+        Raises CircuitOpenError without calling OpenAI while the circuit is open.
+        """
+        def send():
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.3,
+                stop=stop
+            )
+            # A losing hedge still used tokens
+            self._record_usage(response)
+            return response
+        
+        def attempt(hedge, on_start):
+            if hedge:
+                # Hedges (capped by the hedger) skip the limiter queue they would otherwise wait in
+                on_start()
+                return send()
+            
+            with self.limiter.slot() as slot:
+                on_start()
+                try:
+                    return send()
+                except openai.RateLimitError:
+                    slot.outcome = THROTTLED
+                    raise
+                except openai.APITimeoutError:
+                    slot.outcome = TIMEOUT
+                    raise
+        
+        if not self.breaker.allow():
+            raise CircuitOpenError("OpenAI circuit is open; not sending requests")
+        
+        try:
+            response = self.hedger.call(attempt)
+        except Exception as e:
+            if _is_upstream_failure(e):
+                self.breaker.record_failure()
+            else:
+                # Upstream answered (429s are the limiter's business, 4xx are ours)
+                self.breaker.record_success()
+            raise
+        
+        self.breaker.record_success()
+        return response.choices[0].message.content.strip()
+    
+    def score_lead(self, lead: Dict, with_reason: bool = True) -> tuple:
+        """Score a lead from 1-10 using AI and return score with reason.
 
+        With with_reason=False only the number is requested (a couple of output
+        tokens, cut short by stop sequences) and the reason is None; use
+        generate_reason() later if it is needed. API errors and unparseable
+        replies are raised, not turned into a default score.
+        """
+        lead_data = self.extract_lead_data(lead)
+        
+        if not with_reason:
+            return self._score_only(lead, lead_data)
+        
+        prompt = f"""{SCORING_INSTRUCTIONS}
 Lead Data:
 {lead_data}
 
@@ -96,55 +256,158 @@ SCORE: 7
 REASON: Good contact information, established company, clear position, moderate price value
 """
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a sales lead scoring expert. Always respond with SCORE: [number] and REASON: [explanation] format."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=150,
-                temperature=0.3
-            )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            # Extract score and reason
-            import re
-            score_match = re.search(r'SCORE:\s*(\d+)', response_text)
-            reason_match = re.search(r'REASON:\s*(.+)', response_text)
-            
-            if score_match:
-                score = int(score_match.group(1))
-                reason = reason_match.group(1).strip() if reason_match else "No reason provided"
-                return score, reason
-            else:
-                # Default if parsing fails
-                return 5, "Unable to parse AI response"
-                
-        except Exception as e:
-            print(f"Error scoring lead {lead.get('id', 'unknown')}: {e}")
-            return 5, f"Error: {str(e)}"  # Default score on error
+        response_text = self._complete(
+            "You are a sales lead scoring expert. Always respond with SCORE: [number] and REASON: [explanation] format.",
+            prompt,
+            max_tokens=150
+        )
+        
+        # Extract score and reason
+        score_match = re.search(r'SCORE:\s*(\d+)', response_text)
+        reason_match = re.search(r'REASON:\s*(.+)', response_text)
+        
+        if not score_match:
+            # Never store a made-up score; the lead is parked for a retry
+            raise ValueError(f"Unable to parse AI response: {response_text!r}")
+        
+        score = int(score_match.group(1))
+        reason = reason_match.group(1).strip() if reason_match else "No reason provided"
+        return score, reason
     
-    def batch_score_leads(self, leads: List[Dict]) -> List[Dict]:
-        """Score multiple leads and return with scores and reasons"""
-        scored_leads = []
+    def _score_only(self, lead: Dict, lead_data: str) -> tuple:
+        prompt = f"""{SCORING_INSTRUCTIONS}
+Lead Data:
+{lead_data}
+
+Respond with only the score as a single number from 1-10.
+"""
         
+        response_text = self._complete(
+            "You are a sales lead scoring expert. Respond with only a number from 1 to 10.",
+            prompt,
+            max_tokens=3,
+            stop=["\n", "."]
+        )
+        
+        score_match = re.search(r'\d+', response_text)
+        if not score_match:
+            raise ValueError(f"Unable to parse AI response: {response_text!r}")
+        return int(score_match.group(0)), None
+    
+    def generate_reason(self, lead: Dict, score: int) -> str:
+        """Explain an existing score; cached per lead version and score.
+
+        API errors are raised (like score_lead), so a failure is never
+        mistaken for a reason.
+        """
+        cache_key = (lead.get('id'), lead.get('updated_at'), score)
+        if cache_key in self.reason_cache:
+            return self.reason_cache[cache_key]
+        
+        prompt = f"""{SCORING_INSTRUCTIONS}
+Lead Data:
+{self.extract_lead_data(lead)}
+
+This lead was scored {score}/10. In one or two sentences, explain why this score was given.
+"""
+        
+        reason = self._complete(
+            "You are a sales lead scoring expert. Explain lead scores briefly.",
+            prompt,
+            max_tokens=100
+        )
+        
+        self.reason_cache[cache_key] = reason
+        return reason
+    
+    def batch_score_leads(self, leads: List[Dict], dedupe_threshold: Optional[float] = None,
+                          with_reasons: bool = True, reason_threshold: Optional[int] = None) -> List[Dict]:
+        """Score multiple leads and return with scores and reasons.
+
+        With a dedupe threshold, near-duplicate leads are clustered and only one
+        representative per cluster is sent to the AI; the other members get its
+        score and reason plus an ai_duplicate_of marker.
+
+        Leads that fail to score (OpenAI errors, unparseable replies or an open
+        circuit) are left out of the result and parked in parked_leads for a
+        later retry.
+
+        With with_reasons=False leads are scored with the score-only prompt and
+        ai_reason is None, except for leads scoring at least reason_threshold,
+        whose reasons are generated right away.
+        """
+        if dedupe_threshold is None:
+            dedupe_threshold = self.dedupe_threshold
+        if dedupe_threshold is None or len(leads) < 2:
+            return [lead for lead in self._score_concurrently(leads, with_reasons, reason_threshold) if lead is not None]
+        
+        representatives = self.cluster_duplicates(leads, dedupe_threshold)
+        
+        unique_indexes = sorted(set(representatives))
+        print(f"Scoring {len(unique_indexes)} representatives for {len(leads)} leads (near-duplicates share scores)")
+        scored_unique = dict(zip(unique_indexes, self._score_concurrently(
+            [leads[i] for i in unique_indexes], with_reasons, reason_threshold
+        )))
+        
+        scored_leads = []
         for i, lead in enumerate(leads):
+            representative = scored_unique[representatives[i]]
+            if representative is None:
+                self.park_lead(lead)
+            elif representatives[i] == i:
+                scored_leads.append(representative)
+            else:
+                scored_leads.append(self.copy_duplicate_score(lead, representative))
+        
+        return scored_leads
+    
+    def cluster_duplicates(self, leads: List[Dict], threshold: float) -> List[int]:
+        """For each lead, the index of its near-duplicate cluster representative"""
+        texts = [self.extract_lead_data(lead) for lead in leads]
+        return LeadDeduplicator(threshold).cluster(texts)
+    
+    @staticmethod
+    def copy_duplicate_score(lead: Dict, representative: Dict) -> Dict:
+        """Give a near-duplicate lead its scored representative's score and reason"""
+        lead_with_score = lead.copy()
+        lead_with_score['ai_score'] = representative['ai_score']
+        if representative.get('ai_reason'):
+            lead_with_score['ai_reason'] = f"{representative['ai_reason']} (near-duplicate of lead {representative.get('id')})"
+        else:
+            lead_with_score['ai_reason'] = None
+        lead_with_score['ai_duplicate_of'] = representative.get('id')
+        return lead_with_score
+    
+    def _score_concurrently(self, leads: List[Dict], with_reasons: bool = True,
+                            reason_threshold: Optional[int] = None) -> List[Dict]:
+        """Score leads concurrently, keeping input order (None for parked leads)"""
+        def score_one(indexed_lead):
+            i, lead = indexed_lead
             try:
                 print(f"Scoring lead {i+1}/{len(leads)}: {lead.get('name', 'Unknown')}")
-                score, reason = self.score_lead(lead)
+                score, reason = self.score_lead(lead, with_reason=with_reasons)
+                
+                # Reasons are only worth paying for on leads we will act on
+                if reason is None and reason_threshold is not None and score >= reason_threshold:
+                    try:
+                        reason = self.generate_reason(lead, score)
+                    except Exception as e:
+                        # The score stands; the reason is generated on demand later
+                        print(f"Error explaining lead {lead.get('id', 'unknown')}: {e}")
+                        reason = None
                 
                 lead_with_score = lead.copy()
                 lead_with_score['ai_score'] = score
                 lead_with_score['ai_reason'] = reason
-                scored_leads.append(lead_with_score)
             except Exception as e:
-                print(f"Error processing lead {i+1}: {e}")
-                # Add lead with default score
-                lead_with_score = lead.copy()
-                lead_with_score['ai_score'] = 5
-                lead_with_score['ai_reason'] = f"Error: {str(e)}"
-                scored_leads.append(lead_with_score)
+                print(f"Error processing lead {i+1}, parking it for retry: {e}")
+                self.park_lead(lead)
+                return None
+            return lead_with_score
         
-        return scored_leads
+        if not leads:
+            return []
+        
+        # The limiter decides how many calls are actually in flight
+        with ThreadPoolExecutor(max_workers=min(self.limiter.max_limit, len(leads))) as executor:
+            return list(executor.map(propagate(score_one), enumerate(leads)))
@@ -1,7 +1,5 @@
 import streamlit as st
 import pandas as pd
-import time
-from kommo_client import KommoClient
 from lead_processor import LeadProcessor
 
 # Page configuration
@@ -13,10 +11,109 @@ st.set_page_config(
 
 # Initialize clients
 @st.cache_resource
-def get_clients():
-    return KommoClient(), LeadProcessor()
+def get_processor():
+    return LeadProcessor()
 
-kommo_client, lead_processor = get_clients()
+lead_processor = get_processor()
+# Share the processor's client so all Kommo calls go through one rate limiter
+kommo_client = lead_processor.kommo_client
+
+SORT_COLUMNS = {
+    "AI Score": "ai_score",
+    "Price": "price",
+    "Scored At": "scored_at",
+    "Name": "name",
+    "ID": "id"
+}
+
+# Widgets rerun the whole script; without caching every page change, sort or
+# filter would re-fetch the account from Kommo (hundreds of requests at 100k leads)
+@st.cache_resource(ttl=300)
+def get_all_leads():
+    """All leads of the account, shared across reruns and sessions (do not modify the list)"""
+    return kommo_client.get_all_leads()
+
+@st.cache_data(ttl=300)
+def get_pipelines():
+    return kommo_client.get_pipelines()
+
+def get_pipeline_names():
+    """Pipeline names by ID, cached so paging the results table does not wait on Kommo"""
+    return {p.get('id'): p.get('name') for p in get_pipelines()}
+
+def render_results_table(key: str, default_min_score: int = 1):
+    """Paginated view of saved results; filtering, sorting and paging run in the Arrow store"""
+    results_store = lead_processor.results_store
+    try:
+        pipeline_names = get_pipeline_names()
+    except Exception:
+        pipeline_names = {}
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        score_range = st.slider("Score range", min_value=1, max_value=10, value=(default_min_score, 10), key=f"{key}_score")
+    with col2:
+        pipeline_ids = st.multiselect(
+            "Pipelines",
+            results_store.distinct('pipeline_id'),
+            format_func=lambda pipeline_id: pipeline_names.get(pipeline_id, str(pipeline_id)),
+            key=f"{key}_pipelines"
+        )
+    with col3:
+        status_ids = st.multiselect("Status IDs", results_store.distinct('status_id'), key=f"{key}_statuses")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sort_label = st.selectbox("Sort by", list(SORT_COLUMNS.keys()), key=f"{key}_sort")
+    with col2:
+        descending = st.checkbox("Descending", value=True, key=f"{key}_desc")
+    with col3:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1, key=f"{key}_page_size")
+    
+    total = results_store.count(score_range[0], score_range[1], pipeline_ids, status_ids)
+    page_count = max(1, -(-total // page_size))
+    with col4:
+        page_number = st.number_input("Page", min_value=1, max_value=page_count, value=1, key=f"{key}_page")
+    
+    rows, total = results_store.query(
+        score_range[0], score_range[1], pipeline_ids, status_ids,
+        sort_by=SORT_COLUMNS[sort_label], descending=descending,
+        page=page_number, page_size=page_size
+    )
+    
+    if not rows:
+        st.info("No scored leads match these filters.")
+        return
+    
+    start = (page_number - 1) * page_size
+    st.caption(f"Showing {start + 1}–{start + len(rows)} of {total} scored leads (page {page_number}/{page_count})")
+    st.dataframe(pd.DataFrame([
+        {
+            "ID": row['id'],
+            "Name": row['name'],
+            "Company": row['company_name'],
+            "AI Score": row['ai_score'],
+            "Scoring Reason": row['ai_reason'] or 'Not generated yet',
+            "Pipeline": row['pipeline_name'] or pipeline_names.get(row['pipeline_id'], row['pipeline_id']),
+            "Status": row['status_name'] or row['status_id'],
+            "Price": row['price']
+        }
+        for row in rows
+    ]), use_container_width=True)
+    
+    # Reasons of low scores are only generated when someone asks for them
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        explain_id = st.selectbox("Explain a lead", [row['id'] for row in rows if not row['ai_reason']],
+                                  key=f"{key}_explain")
+    with col2:
+        if explain_id and st.button("💬 Generate reason", key=f"{key}_explain_button"):
+            try:
+                with st.spinner("Generating reason..."):
+                    reason = lead_processor.get_reason(explain_id)
+                st.info(reason or "No saved score for this lead")
+            except Exception as e:
+                st.error(f"Could not generate a reason: {e}")
 
 # Main title
 st.title("🎯 Kommo Lead Scoring App")
@@ -32,6 +129,43 @@ page = st.sidebar.selectbox("Choose a page", [
     "Lead Analytics"
 ])
 
+if st.sidebar.button("🔄 Reload leads from Kommo", help="Leads and pipelines are cached for 5 minutes"):
+    get_all_leads.clear()
+    get_pipelines.clear()
+
+# Opt-in profiling of scoring/tagging/moving runs
+profile_runs = st.sidebar.checkbox("🔬 Profile runs", value=lead_processor.profiler.enabled,
+                                   help="Writes a collapsed-stack file and per-stage timings to ./profiles for each run.")
+if profile_runs and not lead_processor.profiler.enabled:
+    lead_processor.enable_profiling("profiles")
+elif not profile_runs and lead_processor.profiler.enabled:
+    lead_processor.disable_profiling()
+
+if lead_processor.profiler.enabled and lead_processor.profiler.last_report:
+    with st.sidebar.expander("⏱️ Last Profile"):
+        report = lead_processor.profiler.last_report
+        st.write(f"**{report['run']}**: {report['wall_seconds']:.1f}s")
+        for stage, data in report['stages'].items():
+            st.write(f"- {stage}: {data['seconds']:.2f}s ({data['percent']:.0f}%)")
+        st.caption(report['folded_file'])
+
+# Adaptive concurrency limits (Kommo / OpenAI)
+with st.sidebar.expander("⚙️ API Concurrency"):
+    for name, stats in lead_processor.get_concurrency_stats().items():
+        st.write(f"**{name}**: {stats['in_flight']}/{stats['limit']} in flight "
+                 f"(429s: {stats['throttled']}, timeouts: {stats['timeouts']})")
+    resilience = lead_processor.get_resilience_stats()
+    breaker = resilience['breaker']
+    st.write(f"**hedging**: {resilience['hedges_issued']} hedges issued, {resilience['hedges_won']} won "
+             f"({resilience['calls']} calls)")
+    st.write(f"**circuit**: {breaker['state']} (opened {breaker['opens']}x, {breaker['rejected']} calls rejected)")
+    if resilience['parked_leads']:
+        st.write(f"**parked**: {resilience['parked_leads']} leads waiting for retry")
+        if st.button("🔁 Retry parked leads"):
+            with st.spinner("Retrying parked leads..."):
+                retry = lead_processor.retry_parked_leads()
+            st.write(f"Scored {len(retry['scored_leads'])} of {retry['retried_leads']} parked leads")
+
 if page == "Dashboard":
     st.header("📊 Dashboard")
     
@@ -48,8 +182,8 @@ if page == "Dashboard":
     
     # Get basic stats
     try:
-        pipelines = kommo_client.get_pipelines()
-        all_leads = kommo_client.get_all_leads()
+        pipelines = get_pipelines()
+        all_leads = get_all_leads()
         
         st.metric("Total Pipelines", len(pipelines))
         st.metric("Total Leads", len(all_leads))
@@ -75,7 +209,7 @@ elif page == "Score All Leads":
     
     # Get total leads count first
     try:
-        all_leads = kommo_client.get_all_leads()
+        all_leads = get_all_leads()
         total_leads = len(all_leads)
         
         if total_leads == 0:
@@ -99,110 +233,97 @@ elif page == "Score All Leads":
             with col2:
                 st.metric("Selected Leads", num_leads)
             
+            # Near-duplicate leads (imports, web forms) can share one AI call
+            dedupe = st.checkbox("Score near-duplicate leads once", value=False,
+                                 help="Leads with almost identical data get the score of one representative lead.")
+            dedupe_threshold = st.slider("Similarity threshold", min_value=0.5, max_value=1.0, value=0.9, step=0.05) if dedupe else None
+            
+            # Score-only requests are much cheaper; reasons can be generated later per lead
+            high_score_reasons_only = st.checkbox("Generate reasons only for high-score leads (score ≥ 5)", value=True,
+                                                  help="Other leads get a score only; use 'Explain a lead' below to generate a reason on demand.")
+            
+            # Budget and priority: the most valuable leads are scored first
+            col1, col2 = st.columns(2)
+            with col1:
+                budget_usd = st.number_input("Budget (USD, 0 = no limit)", min_value=0.0, value=0.0, step=0.10)
+            with col2:
+                deadline_minutes = st.number_input("Time limit (minutes, 0 = no limit)", min_value=0, value=0)
+            priority = st.multiselect(
+                "Priority order",
+                ["unscored", "pipelines", "recent", "price"],
+                default=["unscored", "recent", "price"],
+                help="Leads are sorted by these rules in order: unscored first, preferred pipelines, recently updated, higher price."
+            )
+            pipeline_options = {f"{p.get('name')} (ID: {p.get('id')})": p.get('id') for p in get_pipelines()}
+            preferred = st.multiselect("Preferred pipelines", list(pipeline_options.keys())) if "pipelines" in priority else []
+            
             # Show estimated time
             estimated_time = num_leads * 2  # Roughly 2 seconds per lead
             st.info(f"⏱️ Estimated time: {estimated_time//60}m {estimated_time%60}s")
             
             if st.button("🚀 Start Scoring Process", type="primary"):
-                with st.spinner(f"Processing {num_leads} leads... This may take a few minutes."):
-                    # Limit leads to the requested number
-                    leads_to_score = all_leads[:num_leads]
-                    
-                    # Score the selected leads
-                    scored_leads = lead_processor.ai_scorer.batch_score_leads(leads_to_score)
-                    
-                    # Add tags to leads
-                    tagged_count = 0
-                    high_score_leads = []
-                    
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    for i, lead in enumerate(scored_leads):
-                        lead_id = lead.get('id')
-                        score = lead.get('ai_score', 0)
+                with lead_processor.profiler.run('ui-score'):
+                    with st.spinner(f"Processing {num_leads} leads... This may take a few minutes."):
+                        # Score the highest-priority leads within the budget
+                        run = lead_processor.score_with_budget(
+                            all_leads,
+                            max_leads=num_leads,
+                            budget_usd=budget_usd or None,
+                            deadline_seconds=deadline_minutes * 60 or None,
+                            priority=priority or None,
+                            preferred_pipelines=[pipeline_options[name] for name in preferred],
+                            dedupe_threshold=dedupe_threshold,
+                            score_only=high_score_reasons_only,
+                            reason_threshold=5 if high_score_reasons_only else None
+                        )
+                        scored_leads = run['scored_leads']
                         
-                        # Add score tag
-                        tag_name = f"AI_Score_{score}"
-                        result = kommo_client.add_tag_to_lead(lead_id, tag_name)
-                        
-                        if result:
-                            tagged_count += 1
+                        # Add tags to leads (concurrently, paced by the Kommo limiter)
+                        tagged_count = lead_processor.tag_leads(scored_leads)
+                        # Tagging changed the leads in Kommo
+                        get_all_leads.clear()
                         
                         # Collect high-scoring leads (score >= 5)
-                        if score >= 5:
-                            high_score_leads.append(lead)
-                        
-                        # Update progress
-                        progress = (i + 1) / len(scored_leads)
-                        progress_bar.progress(progress)
-                        status_text.text(f"Processing lead {i+1}/{len(scored_leads)}: {lead.get('name', 'Unknown')}")
-                        
-                        # Small delay to avoid rate limiting
-                        time.sleep(0.1)
-                
-                st.success(f"✅ Successfully processed {len(scored_leads)} leads!")
-                st.info(f"📊 Tagged {tagged_count} leads with AI scores")
-                st.info(f"⭐ Found {len(high_score_leads)} high-scoring leads (score ≥ 5)")
-                
-                # Show score distribution
-                if scored_leads:
-                    st.subheader("📊 Score Distribution")
-                    score_counts = {}
-                    for lead in scored_leads:
-                        score = lead.get('ai_score', 0)
-                        score_counts[score] = score_counts.get(score, 0) + 1
+                        high_score_leads = [lead for lead in scored_leads if lead.get('ai_score', 0) >= 5]
                     
-                    score_df = pd.DataFrame([
-                        {"Score": score, "Count": count}
-                        for score, count in sorted(score_counts.items())
-                    ])
-                    st.bar_chart(score_df.set_index('Score'))
-                
-                # Show ALL scored leads
-                st.subheader("📋 All Scored Leads")
-                all_scored_df = pd.DataFrame([
-                    {
-                        "ID": lead.get('id'),
-                        "Name": lead.get('name'),
-                        "Company": lead.get('company_name', ''),
-                        "AI Score": lead.get('ai_score'),
-                        "Scoring Reason": lead.get('ai_reason', 'No reason provided'),
-                        "Pipeline": lead.get('pipeline', {}).get('name', ''),
-                        "Status": lead.get('status', {}).get('name', '') if isinstance(lead.get('status'), dict) else 'Unknown',
-                        "Price": lead.get('price', 0)
-                    }
-                    for lead in scored_leads
-                ])
-                st.dataframe(all_scored_df, use_container_width=True)
-                
-                # Show high-scoring leads separately
-                if high_score_leads:
-                    st.subheader("⭐ High-Scoring Leads (Score ≥ 5)")
-                    high_score_df = pd.DataFrame([
-                        {
-                            "ID": lead.get('id'),
-                            "Name": lead.get('name'),
-                            "Company": lead.get('company_name', ''),
-                            "Score": lead.get('ai_score'),
-                            "Reason": lead.get('ai_reason', 'No reason provided'),
-                            "Pipeline": lead.get('pipeline', {}).get('name', ''),
-                            "Status": lead.get('status', {}).get('name', '') if isinstance(lead.get('status'), dict) else 'Unknown'
-                        }
-                        for lead in high_score_leads
-                    ])
-                    st.dataframe(high_score_df, use_container_width=True)
+                    st.success(f"✅ Successfully processed {len(scored_leads)} leads!")
+                    st.info(f"💰 Spent {run['spent_tokens']} tokens (${run['spent_usd']:.4f})")
+                    if run['pending_count']:
+                        st.warning(f"⏸️ Stopped ({run['stop_reason']}): {run['pending_count']} leads still pending")
+                    if run['parked_leads']:
+                        st.warning(f"🅿️ {len(run['parked_leads'])} leads could not be scored (OpenAI errors) and were parked for retry")
+                    st.info(f"📊 Tagged {tagged_count} leads with AI scores")
+                    st.info(f"⭐ Found {len(high_score_leads)} high-scoring leads (score ≥ 5)")
+                    
+                    # Show score distribution
+                    with lead_processor.profiler.stage('render'):
+                        if scored_leads:
+                            st.subheader("📊 Score Distribution")
+                            score_counts = {}
+                            for lead in scored_leads:
+                                score = lead.get('ai_score', 0)
+                                score_counts[score] = score_counts.get(score, 0) + 1
+                            
+                            score_df = pd.DataFrame([
+                                {"Score": score, "Count": count}
+                                for score, count in sorted(score_counts.items())
+                            ])
+                            st.bar_chart(score_df.set_index('Score'))
     
     except Exception as e:
         st.error(f"Error loading leads: {e}")
+    
+    # All saved results, one page at a time
+    st.subheader("📋 All Scored Leads")
+    render_results_table("score_all")
 
 elif page == "Move High-Score Leads":
     st.header("📤 Move High-Score Leads")
-    st.markdown("Move leads with AI score ≥ 5 to a target pipeline.")
+    st.markdown("Move leads with AI score ≥ 5 to a target pipeline. Saved scores and existing AI_Score tags are reused; only unscored or updated leads are re-scored.")
     
     # Get pipelines for selection
     try:
-        pipelines = kommo_client.get_pipelines()
+        pipelines = get_pipelines()
         pipeline_options = {f"{p.get('name')} (ID: {p.get('id')})": p.get('id') for p in pipelines}
         
         target_pipeline = st.selectbox("Select Target Pipeline", list(pipeline_options.keys()))
@@ -216,7 +337,7 @@ elif page == "Move High-Score Leads":
         target_status_id = status_options[target_status]
         
         # Get total leads count
-        all_leads = kommo_client.get_all_leads()
+        all_leads = get_all_leads()
         total_leads = len(all_leads)
         
         if total_leads == 0:
@@ -245,68 +366,50 @@ elif page == "Move High-Score Leads":
             st.info(f"⏱️ Estimated time: {estimated_time//60}m {estimated_time%60}s")
             
             if st.button("🚀 Move High-Score Leads", type="primary"):
-                with st.spinner(f"Processing {num_leads} leads... This may take a few minutes."):
-                    # Limit leads to the requested number
-                    leads_to_process = all_leads[:num_leads]
-                    
-                    # Score the selected leads first
-                    scored_leads = lead_processor.ai_scorer.batch_score_leads(leads_to_process)
-                    
-                    # Find high-scoring leads
-                    high_score_leads = [lead for lead in scored_leads if lead.get('ai_score', 0) >= 5]
-                    
-                    if not high_score_leads:
-                        st.info("No high-scoring leads found in the selected batch.")
-                    else:
-                        # Move high-scoring leads
-                        moved_count = 0
+                with lead_processor.profiler.run('ui-move'):
+                    with st.spinner(f"Processing {num_leads} leads... This may take a few minutes."):
+                        # Limit leads to the requested number
+                        leads_to_process = all_leads[:num_leads]
                         
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
+                        # Use persisted scores; only unscored or stale leads are re-scored
+                        scored_leads = lead_processor.resolve_scores(leads_to_process)
                         
-                        for i, lead in enumerate(high_score_leads):
-                            lead_id = lead.get('id')
-                            current_pipeline = lead.get('pipeline', {}).get('id')
-                            
-                            # Only move if not already in target pipeline
-                            if current_pipeline != target_pipeline_id:
-                                result = kommo_client.move_lead_to_pipeline(
-                                    lead_id, 
-                                    target_pipeline_id, 
-                                    target_status_id
-                                )
-                                
-                                if result:
-                                    moved_count += 1
+                        # Find high-scoring leads
+                        high_score_leads = [lead for lead in scored_leads if lead.get('ai_score', 0) >= 5]
+                        
+                        if not high_score_leads:
+                            st.info("No high-scoring leads found in the selected batch.")
+                        else:
+                            # Move high-scoring leads concurrently; updates the score and results stores
+                            moved_ids = lead_processor.move_leads(high_score_leads, target_pipeline_id, target_status_id)
+                            get_all_leads.clear()
+                            moved_count = len(moved_ids)
                             
-                            # Update progress
-                            progress = (i + 1) / len(high_score_leads)
-                            progress_bar.progress(progress)
-                            status_text.text(f"Moving lead {i+1}/{len(high_score_leads)}: {lead.get('name', 'Unknown')}")
+                            st.success(f"✅ Successfully moved {moved_count} high-scoring leads!")
+                            st.info(f"📊 Total high-scoring leads found: {len(high_score_leads)}")
+                            st.info(f"🎯 Target pipeline: {target_pipeline}")
                             
-                            # Small delay to avoid rate limiting
-                            time.sleep(0.1)
-                        
-                        st.success(f"✅ Successfully moved {moved_count} high-scoring leads!")
-                        st.info(f"📊 Total high-scoring leads found: {len(high_score_leads)}")
-                        st.info(f"🎯 Target pipeline: {target_pipeline}")
-                        
-                        # Show moved leads
-                        if moved_count > 0:
-                            st.subheader("📤 Moved Leads")
-                            moved_df = pd.DataFrame([
-                                {
-                                    "ID": lead.get('id'),
-                                    "Name": lead.get('name'),
-                                    "Company": lead.get('company_name', ''),
-                                    "Score": lead.get('ai_score'),
-                                    "Reason": lead.get('ai_reason', 'No reason provided'),
-                                    "Previous Pipeline": lead.get('pipeline', {}).get('name', ''),
-                                    "New Status": target_status
-                                }
-                                for lead in high_score_leads[:moved_count]
-                            ])
-                            st.dataframe(moved_df, use_container_width=True)
+                            # Show moved leads
+                            with lead_processor.profiler.stage('render'):
+                                if moved_count > 0:
+                                    st.subheader("📤 Moved Leads")
+                                    try:
+                                        pipeline_names = get_pipeline_names()
+                                    except Exception:
+                                        pipeline_names = {}
+                                    moved_df = pd.DataFrame([
+                                        {
+                                            "ID": lead.get('id'),
+                                            "Name": lead.get('name'),
+                                            "Company": lead.get('company_name', ''),
+                                            "Score": lead.get('ai_score'),
+                                            "Reason": lead.get('ai_reason', 'No reason provided'),
+                                            "Previous Pipeline": pipeline_names.get(lead.get('pipeline_id'), lead.get('pipeline_id')),
+                                            "New Status": target_status
+                                        }
+                                        for lead in high_score_leads if lead.get('id') in moved_ids
+                                    ])
+                                    st.dataframe(moved_df, use_container_width=True)
     
     except Exception as e:
         st.error(f"Error loading pipelines: {e}")
@@ -315,13 +418,13 @@ elif page == "Pipeline Management":
     st.header("📋 Pipeline Management")
     
     try:
-        pipelines = kommo_client.get_pipelines()
+        pipelines = get_pipelines()
         
         # Add lead count selection for pipeline analysis
         st.subheader("🔍 Pipeline Analysis")
         
         # Get total leads count
-        all_leads = kommo_client.get_all_leads()
+        all_leads = get_all_leads()
         total_leads = len(all_leads)
         
         if total_leads == 0:
@@ -411,9 +514,75 @@ elif page == "Pipeline Management":
 elif page == "Lead Analytics":
     st.header("📈 Lead Analytics")
     
-    # Get total leads count
+    # Saved summary is maintained incrementally, so this renders immediately
+    summary = lead_processor.score_store.get_summary()
+    
+    st.subheader("📊 Summary Metrics")
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Total Scored", summary['total_leads'])
+    
+    with col2:
+        st.metric("High-Score Leads", summary['high_score_count'])
+    
+    with col3:
+        high_score_percentage = (summary['high_score_count'] / summary['total_leads'] * 100) if summary['total_leads'] else 0
+        st.metric("High-Score %", f"{high_score_percentage:.1f}%")
+    
+    with col4:
+        st.metric("Average Score", f"{summary['average_score']:.1f}")
+    
+    if summary['total_leads'] == 0:
+        st.info("No scored leads yet. Score some leads below to build the analytics.")
+    else:
+        # Score distribution
+        st.subheader("📊 Score Distribution")
+        score_df = pd.DataFrame([
+            {"Score": score, "Count": count}
+            for score, count in sorted(summary['score_distribution'].items())
+        ])
+        st.bar_chart(score_df.set_index('Score'))
+        
+        # Score distribution table
+        st.subheader("📋 Detailed Score Breakdown")
+        st.dataframe(score_df, use_container_width=True)
+        
+        # Pipeline analysis
+        st.subheader("📈 Pipeline Analysis")
+        try:
+            pipeline_names = {str(pipeline_id): name for pipeline_id, name in get_pipeline_names().items()}
+        except Exception:
+            pipeline_names = {}
+        
+        pipeline_df = pd.DataFrame([
+            {
+                "Pipeline": pipeline_names.get(pipeline_id, pipeline_id),
+                "Total Leads": data['total'],
+                "High-Score Leads": data['high_score'],
+                "High-Score %": (data['high_score'] / data['total'] * 100) if data['total'] > 0 else 0,
+                "Avg Score": data['average_score']
+            }
+            for pipeline_id, data in summary['by_pipeline'].items()
+        ])
+        st.dataframe(pipeline_df, use_container_width=True)
+        
+        # Status analysis
+        st.subheader("📋 Status Breakdown")
+        status_df = pd.DataFrame([
+            {"Status ID": status_id, "Scored Leads": count}
+            for status_id, count in summary['by_status'].items()
+        ])
+        st.dataframe(status_df, use_container_width=True)
+        
+        # Scored leads from the results store, one page at a time
+        st.subheader("⭐ Scored Leads")
+        render_results_table("analytics", default_min_score=5)
+    
+    # Score more leads to extend the analytics
+    st.subheader("🤖 Score More Leads")
     try:
-        all_leads = kommo_client.get_all_leads()
+        all_leads = get_all_leads()
         total_leads = len(all_leads)
         
         if total_leads == 0:
@@ -431,128 +600,19 @@ elif page == "Lead Analytics":
                     min_value=1,
                     max_value=max_leads,
                     value=min(100, total_leads),  # Default to 100 or total if less
-                    help=f"Maximum: {max_leads} leads. Analysis takes time, so start with a smaller number for testing."
+                    help=f"Maximum: {max_leads} leads. Leads that already have a saved score are not re-scored."
                 )
             
             with col2:
                 st.metric("Selected Leads", num_leads)
             
-            # Show estimated time
-            estimated_time = num_leads * 2  # Roughly 2 seconds per lead
-            st.info(f"⏱️ Estimated time: {estimated_time//60}m {estimated_time%60}s")
-            
-            if st.button("📊 Generate Analytics", type="primary"):
+            if st.button("📊 Update Analytics", type="primary"):
                 with st.spinner(f"Analyzing {num_leads} leads... This may take a few minutes."):
-                    # Limit leads to the requested number
-                    leads_to_analyze = all_leads[:num_leads]
-                    
-                    # Score the selected leads
-                    scored_leads = lead_processor.ai_scorer.batch_score_leads(leads_to_analyze)
-                    
-                    # Calculate score distribution
-                    score_distribution = {}
-                    for lead in scored_leads:
-                        score = lead.get('ai_score', 0)
-                        score_distribution[score] = score_distribution.get(score, 0) + 1
-                    
-                    # Find high-scoring leads
-                    high_score_leads = [lead for lead in scored_leads if lead.get('ai_score', 0) >= 5]
-                
-                st.success("✅ Analytics generated!")
-                
-                # Show summary metrics
-                st.subheader("📊 Summary Metrics")
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    st.metric("Total Analyzed", len(scored_leads))
-                
-                with col2:
-                    st.metric("High-Score Leads", len(high_score_leads))
-                
-                with col3:
-                    high_score_percentage = (len(high_score_leads) / len(scored_leads) * 100) if scored_leads else 0
-                    st.metric("High-Score %", f"{high_score_percentage:.1f}%")
-                
-                with col4:
-                    avg_score = sum(lead.get('ai_score', 0) for lead in scored_leads) / len(scored_leads) if scored_leads else 0
-                    st.metric("Average Score", f"{avg_score:.1f}")
-                
-                # Score distribution
-                st.subheader("📊 Score Distribution")
-                score_df = pd.DataFrame([
-                    {"Score": score, "Count": count}
-                    for score, count in sorted(score_distribution.items())
-                ])
-                st.bar_chart(score_df.set_index('Score'))
-                
-                # Score distribution table
-                st.subheader("📋 Detailed Score Breakdown")
-                st.dataframe(score_df, use_container_width=True)
-                
-                # Show ALL scored leads
-                st.subheader("📋 All Scored Leads")
-                all_scored_df = pd.DataFrame([
-                    {
-                        "ID": lead.get('id'),
-                        "Name": lead.get('name'),
-                        "Company": lead.get('company_name', ''),
-                        "AI Score": lead.get('ai_score'),
-                        "Scoring Reason": lead.get('ai_reason', 'No reason provided'),
-                        "Pipeline": lead.get('pipeline', {}).get('name', ''),
-                        "Status": lead.get('status', {}).get('name', '') if isinstance(lead.get('status'), dict) else 'Unknown',
-                        "Price": lead.get('price', 0)
-                    }
-                    for lead in scored_leads
-                ])
-                st.dataframe(all_scored_df, use_container_width=True)
-                
-                # Show high-scoring leads separately
-                if high_score_leads:
-                    st.subheader("⭐ High-Scoring Leads (Score ≥ 5)")
-                    high_score_df = pd.DataFrame([
-                        {
-                            "ID": lead.get('id'),
-                            "Name": lead.get('name'),
-                            "Company": lead.get('company_name', ''),
-                            "AI Score": lead.get('ai_score'),
-                            "Scoring Reason": lead.get('ai_reason', 'No reason provided'),
-                            "Pipeline": lead.get('pipeline', {}).get('name', ''),
-                            "Status": lead.get('status', {}).get('name', '') if isinstance(lead.get('status'), dict) else 'Unknown',
-                            "Price": lead.get('price', 0)
-                        }
-                        for lead in high_score_leads
-                    ])
-                    st.dataframe(high_score_df, use_container_width=True)
-                else:
-                    st.info("No high-scoring leads found in the analyzed batch.")
-                
-                # Pipeline analysis
-                st.subheader("📈 Pipeline Analysis")
-                pipeline_analysis = {}
-                for lead in scored_leads:
-                    pipeline_name = lead.get('pipeline', {}).get('name', 'Unknown')
-                    if pipeline_name not in pipeline_analysis:
-                        pipeline_analysis[pipeline_name] = {'total': 0, 'high_score': 0, 'scores': []}
-                    
-                    pipeline_analysis[pipeline_name]['total'] += 1
-                    pipeline_analysis[pipeline_name]['scores'].append(lead.get('ai_score', 0))
-                    
-                    if lead.get('ai_score', 0) >= 5:
-                        pipeline_analysis[pipeline_name]['high_score'] += 1
+                    # Only unscored or stale leads are sent to the AI; results update the saved summary
+                    lead_processor.resolve_scores(all_leads[:num_leads])
                 
-                # Create pipeline analysis dataframe
-                pipeline_df = pd.DataFrame([
-                    {
-                        "Pipeline": pipeline,
-                        "Total Leads": data['total'],
-                        "High-Score Leads": data['high_score'],
-                        "High-Score %": (data['high_score'] / data['total'] * 100) if data['total'] > 0 else 0,
-                        "Avg Score": sum(data['scores']) / len(data['scores']) if data['scores'] else 0
-                    }
-                    for pipeline, data in pipeline_analysis.items()
-                ])
-                st.dataframe(pipeline_df, use_container_width=True)
+                st.success("✅ Analytics updated!")
+                st.rerun()
     
     except Exception as e:
         st.error(f"Error loading leads: {e}")
@@ -0,0 +1,240 @@
+"""Headless batch runner for cron jobs and containers.
+
+Usage:
+    python cli.py score --limit 500 --budget-usd 2 --out scores.jsonl
+    python cli.py tag
+    python cli.py move --pipeline 123 [--status 456]
+    python cli.py summary
+    python cli.py sync
+    python cli.py accounts accounts.json --workers 8 --tag
+    python cli.py --profile profiles score --limit 100
+
+Only argparse/json are imported at startup; Kommo, OpenAI and pyarrow are
+imported by the subcommands that need them.
+"""
+import argparse
+import contextlib
+import json
+import sys
+
+from score_store import DEFAULT_STORE_PATH, HIGH_SCORE_THRESHOLD
+
+OUTPUT_FIELDS = ['id', 'name', 'ai_score', 'ai_reason', 'ai_duplicate_of', 'pipeline_id', 'status_id', 'price', 'updated_at']
+
+
+def _output_record(lead):
+    return {field: lead.get(field) for field in OUTPUT_FIELDS}
+
+
+class JsonlWriter:
+    """Write one JSON object per line, flushing after each batch"""
+
+    def __init__(self, stream, owns_stream: bool = False):
+        self.stream = stream
+        self.owns_stream = owns_stream
+
+    def write(self, leads):
+        for lead in leads:
+            self.stream.write(json.dumps(_output_record(lead), default=str) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.owns_stream:
+            self.stream.close()
+
+
+class ParquetWriter:
+    """Write each batch as a Parquet row group"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('name', pa.string()),
+            ('ai_score', pa.int64()),
+            ('ai_reason', pa.string()),
+            ('ai_duplicate_of', pa.int64()),
+            ('pipeline_id', pa.int64()),
+            ('status_id', pa.int64()),
+            ('price', pa.float64()),
+            ('updated_at', pa.int64())
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, leads):
+        if leads:
+            records = [_output_record(lead) for lead in leads]
+            self.writer.write_table(self.pa.Table.from_pylist(records, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _open_writer(path, stdout):
+    if not path or path == '-':
+        return JsonlWriter(stdout)
+    if path.endswith('.parquet'):
+        return ParquetWriter(path)
+    return JsonlWriter(open(path, 'w', encoding='utf-8'), owns_stream=True)
+
+
+def _processor(args):
+    from lead_processor import LeadProcessor
+    processor = LeadProcessor(store_path=args.store)
+    args.opened.append(processor)
+    if args.profile:
+        processor.enable_profiling(args.profile)
+    return processor
+
+
+def cmd_score(args, stdout):
+    processor = _processor(args)
+    leads = processor.kommo_client.get_all_leads()
+
+    writer = _open_writer(args.out, stdout)
+    try:
+        run = processor.score_with_budget(
+            leads,
+            max_leads=args.limit,
+            on_chunk=writer.write,
+            budget_usd=args.budget_usd,
+            budget_tokens=args.budget_tokens,
+            deadline_seconds=args.deadline,
+            priority=args.priority.split(',') if args.priority else None,
+            preferred_pipelines=args.pipeline,
+            dedupe_threshold=args.dedupe,
+            score_only=args.reasons != 'all',
+            reason_threshold=HIGH_SCORE_THRESHOLD if args.reasons == 'high' else None
+        )
+    finally:
+        writer.close()
+
+    if args.tag:
+        run['tagged_leads'] = processor.tag_leads(run['scored_leads'])
+
+    return {
+        "scored": len(run['scored_leads']),
+        "pending": run['pending_count'],
+        "parked": len(run['parked_leads']),
+        "stop_reason": run['stop_reason'],
+        "spent_tokens": run['spent_tokens'],
+        "spent_usd": round(run['spent_usd'], 6),
+        "tagged_leads": run.get('tagged_leads'),
+        "openai": processor.get_resilience_stats()
+    }
+
+
+def cmd_tag(args, stdout):
+    processor = _processor(args)
+    leads = processor.kommo_client.get_all_leads()
+    scored_leads = processor.resolve_scores(leads, rescore=not args.no_rescore)
+
+    writer = _open_writer(args.out, stdout) if args.out else None
+    if writer:
+        writer.write(scored_leads)
+        writer.close()
+
+    return {
+        "total_leads": len(leads),
+        "scored_leads": len(scored_leads),
+        "tagged_leads": processor.tag_leads(scored_leads)
+    }
+
+
+def cmd_move(args, stdout):
+    processor = _processor(args)
+    return processor.move_high_score_leads(args.pipeline, args.status, rescore=not args.no_rescore)
+
+
+def cmd_summary(args, stdout):
+    # Reads the persisted summary only; no Kommo/OpenAI clients needed
+    from score_store import ScoreStore
+    return ScoreStore(args.store).get_summary()
+
+
+def cmd_sync(args, stdout):
+    return _processor(args).sync_scores_from_tags()
+
+
+def cmd_accounts(args, stdout):
+    from tenants import MultiTenantRunner, load_accounts
+    accounts = load_accounts(args.accounts_file, args.data_dir)
+    runner = MultiTenantRunner(accounts, max_workers=args.workers, chunk_size=args.chunk_size)
+    args.opened.append(runner)
+    return runner.run(max_leads_per_account=args.limit, tag=args.tag)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Kommo AI lead scoring batch runner")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help=f"Score store path (default: {DEFAULT_STORE_PATH})")
+    parser.add_argument('--profile', metavar='DIR', help="Profile the run; write collapsed stacks and stage timings to DIR")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    score = subparsers.add_parser('score', help="Score leads in priority order within a budget")
+    score.add_argument('--limit', type=int, help="Maximum number of leads to consider")
+    score.add_argument('--budget-usd', type=float, help="Stop once this much has been spent on OpenAI")
+    score.add_argument('--budget-tokens', type=int, help="Stop once this many tokens have been used")
+    score.add_argument('--deadline', type=float, help="Stop after this many seconds")
+    score.add_argument('--priority', help="Comma-separated rules: unscored,pipelines,recent,price")
+    score.add_argument('--pipeline', type=int, action='append', help="Preferred pipeline ID (repeatable)")
+    score.add_argument('--dedupe', type=float, help="Score near-duplicates once above this similarity (e.g. 0.9)")
+    score.add_argument('--reasons', choices=['all', 'high', 'none'], default='high',
+                       help="Which leads get a text reason: all, high-score only (default) or none")
+    score.add_argument('--tag', action='store_true', help="Also add AI_Score tags to the scored leads")
+    score.add_argument('--out', help="Output file (.jsonl or .parquet); JSONL to stdout by default")
+    score.set_defaults(func=cmd_score)
+
+    tag = subparsers.add_parser('tag', help="Add AI_Score tags using saved scores")
+    tag.add_argument('--no-rescore', action='store_true', help="Skip leads without a fresh saved score")
+    tag.add_argument('--out', help="Also write the scored leads (.jsonl or .parquet, '-' for stdout)")
+    tag.set_defaults(func=cmd_tag)
+
+    move = subparsers.add_parser('move', help="Move high-score leads to a pipeline")
+    move.add_argument('--pipeline', type=int, required=True, help="Target pipeline ID")
+    move.add_argument('--status', type=int, help="Target status ID (default: first status)")
+    move.add_argument('--no-rescore', action='store_true', help="Skip leads without a fresh saved score")
+    move.set_defaults(func=cmd_move)
+
+    summary = subparsers.add_parser('summary', help="Print the saved score summary")
+    summary.set_defaults(func=cmd_summary)
+
+    sync = subparsers.add_parser('sync', help="Import existing AI_Score tags into the score store")
+    sync.set_defaults(func=cmd_sync)
+
+    accounts = subparsers.add_parser('accounts', help="Score leads of several Kommo accounts concurrently")
+    accounts.add_argument('accounts_file', help="JSON list of {name, kommo_base_url, kommo_api_key[, openai_api_key]}")
+    accounts.add_argument('--data-dir', default='accounts', help="Per-account score/results directory (default: accounts)")
+    accounts.add_argument('--workers', type=int, default=8, help="Accounts processed at the same time")
+    accounts.add_argument('--chunk-size', type=int, default=25, help="Leads per scheduling slice")
+    accounts.add_argument('--limit', type=int, help="Maximum leads per account")
+    accounts.add_argument('--tag', action='store_true', help="Also add AI_Score tags")
+    accounts.set_defaults(func=cmd_accounts)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    stdout = sys.stdout
+
+    # Processors/runners created by the command, closed when it is done
+    args.opened = []
+
+    # Progress messages go to stderr so stdout stays machine-readable
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            result = args.func(args, stdout)
+        finally:
+            for opened in args.opened:
+                opened.close()
+
+    streams_to_stdout = getattr(args, 'out', None) == '-' or (args.command == 'score' and not args.out)
+    print(json.dumps(result, default=str), file=sys.stderr if streams_to_stdout else stdout)
+    return 1 if isinstance(result, dict) and 'error' in result else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
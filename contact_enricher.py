@@ -0,0 +1,142 @@
+import requests
+import time
+from typing import Dict, List, Optional
+
+ENRICH_PAGE_SIZE = 250
+REFRESH_INTERVAL = 300  # seconds between updated_at sync queries
+
+
+class ContactCache:
+    """Contacts and companies by ID, invalidated by their updated_at"""
+
+    def __init__(self):
+        self.entities = {'contacts': {}, 'companies': {}}
+        self.last_sync = None
+
+    def get(self, entity: str, entity_id) -> Optional[Dict]:
+        return self.entities[entity].get(entity_id)
+
+    def missing(self, entity: str, entity_ids) -> List:
+        return [entity_id for entity_id in entity_ids if entity_id not in self.entities[entity]]
+
+    def put(self, entity: str, items: List[Dict]):
+        cached = self.entities[entity]
+        for item in items:
+            item_id = item.get('id')
+            current = cached.get(item_id)
+            # Never replace a newer copy with an older one
+            if current is None or (item.get('updated_at') or 0) >= (current.get('updated_at') or 0):
+                cached[item_id] = item
+
+
+def _field_values(entity: Dict, field_code: str) -> List[Dict]:
+    """Values of a contact custom field (PHONE, EMAIL, POSITION)"""
+    for field in entity.get('custom_fields_values', []) or []:
+        if field.get('field_code') == field_code:
+            return [{'value': v.get('value', '')} for v in field.get('values', []) or [] if v.get('value')]
+    return []
+
+
+class ContactEnricher:
+    """Attach contact and company data to leads before scoring.
+
+    Contact and company IDs are collected across a page of leads and fetched
+    in bulk, so enrichment costs a few requests per page instead of one per
+    lead. Cached entries are refreshed by querying for contacts and companies
+    whose updated_at moved since the last sync.
+    """
+
+    def __init__(self, kommo_client, cache: Optional[ContactCache] = None):
+        self.kommo_client = kommo_client
+        self.cache = cache or ContactCache()
+
+    def refresh_changed(self):
+        """Re-fetch cached contacts/companies modified since the last sync"""
+        now = int(time.time())
+        if self.cache.last_sync is not None and now - self.cache.last_sync < REFRESH_INTERVAL:
+            return
+
+        if self.cache.last_sync is not None:
+            try:
+                for entity in ('contacts', 'companies'):
+                    cached = self.cache.entities[entity]
+                    if cached:
+                        changed = self.kommo_client.get_updated_since(entity, self.cache.last_sync)
+                        self.cache.put(entity, [item for item in changed if item.get('id') in cached])
+            except requests.exceptions.RequestException as e:
+                # Keep last_sync so the next enrich() asks for the same window again
+                print(f"Could not sync changed contacts/companies: {e}")
+                return
+
+        self.cache.last_sync = now
+
+    def enrich(self, leads: List[Dict]) -> List[Dict]:
+        """Add phone, email, position and company name to leads in place"""
+        if not leads:
+            return leads
+
+        self.refresh_changed()
+
+        for start in range(0, len(leads), ENRICH_PAGE_SIZE):
+            self._enrich_page(leads[start:start + ENRICH_PAGE_SIZE])
+
+        return leads
+
+    def _enrich_page(self, leads: List[Dict]):
+        contact_ids = set()
+        company_ids = set()
+        for lead in leads:
+            contact_id = self._main_contact_id(lead)
+            if contact_id:
+                contact_ids.add(contact_id)
+            company_id = self._company_id(lead)
+            if company_id:
+                company_ids.add(company_id)
+
+        missing_contacts = self.cache.missing('contacts', contact_ids)
+        if missing_contacts:
+            self.cache.put('contacts', self.kommo_client.get_contacts_by_ids(missing_contacts))
+
+        # Contacts may link to a company the lead itself does not reference
+        for contact_id in contact_ids:
+            contact = self.cache.get('contacts', contact_id) or {}
+            company_id = self._company_id(contact)
+            if company_id:
+                company_ids.add(company_id)
+
+        missing_companies = self.cache.missing('companies', company_ids)
+        if missing_companies:
+            self.cache.put('companies', self.kommo_client.get_companies_by_ids(missing_companies))
+
+        for lead in leads:
+            self._attach(lead)
+
+    def _attach(self, lead: Dict):
+        contact = self.cache.get('contacts', self._main_contact_id(lead)) or {}
+        company_id = self._company_id(lead) or self._company_id(contact)
+        company = self.cache.get('companies', company_id) or {}
+
+        if contact:
+            if not lead.get('phone'):
+                lead['phone'] = _field_values(contact, 'PHONE')
+            if not lead.get('email'):
+                lead['email'] = _field_values(contact, 'EMAIL')
+            if not lead.get('position'):
+                position = _field_values(contact, 'POSITION')
+                lead['position'] = position[0]['value'] if position else ''
+
+        if company and not lead.get('company_name'):
+            lead['company_name'] = company.get('name', '')
+
+    @staticmethod
+    def _main_contact_id(entity: Dict):
+        contacts = (entity.get('_embedded', {}) or {}).get('contacts', []) or []
+        for contact in contacts:
+            if contact.get('is_main'):
+                return contact.get('id')
+        return contacts[0].get('id') if contacts else None
+
+    @staticmethod
+    def _company_id(entity: Dict):
+        companies = (entity.get('_embedded', {}) or {}).get('companies', []) or []
+        return companies[0].get('id') if companies else None
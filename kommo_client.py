@@ -1,35 +1,73 @@
 import requests
 import json
+import time
 from typing import List, Dict, Optional
 from config import KOMMO_BASE_URL, KOMMO_API_KEY
+from adaptive_limiter import AdaptiveLimiter, THROTTLED, TIMEOUT
+from score_store import SCORE_TAG_PATTERN
+
+REQUEST_TIMEOUT = 30  # seconds
+MAX_THROTTLE_RETRIES = 3
 
 class KommoClient:
-    def __init__(self):
-        self.base_url = KOMMO_BASE_URL
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        # Credentials default to config; pass both to serve another account.
+        # Never mix one account's URL with another's key.
+        if not base_url and not api_key:
+            base_url, api_key = KOMMO_BASE_URL, KOMMO_API_KEY
+        elif not base_url or not api_key:
+            raise ValueError("Kommo base URL and API key must be given together")
+        self.base_url = base_url
         self.headers = {
-            'Authorization': f'Bearer {KOMMO_API_KEY}',
+            'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json'
         }
+        # Kommo allows ~7 requests/second per account
+        self.limiter = AdaptiveLimiter('kommo', initial_limit=2, max_limit=8)
+    
+    def _send(self, method: str, url: str, data: Optional[Dict] = None) -> requests.Response:
+        if method.upper() == 'GET':
+            return requests.get(url, headers=self.headers, timeout=REQUEST_TIMEOUT)
+        elif method.upper() == 'POST':
+            return requests.post(url, headers=self.headers, json=data, timeout=REQUEST_TIMEOUT)
+        elif method.upper() == 'PATCH':
+            return requests.patch(url, headers=self.headers, json=data, timeout=REQUEST_TIMEOUT)
+        else:
+            raise ValueError(f"Unsupported HTTP method: {method}")
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
-        """Make API request to Kommo"""
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                      raise_errors: bool = False) -> Dict:
+        """Make API request to Kommo (errors return {} unless raise_errors is set)"""
         url = f"{self.base_url}/{endpoint}"
         
-        try:
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers)
-            elif method.upper() == 'POST':
-                response = requests.post(url, headers=self.headers, json=data)
-            elif method.upper() == 'PATCH':
-                response = requests.patch(url, headers=self.headers, json=data)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"API request failed: {e}")
-            return {}
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            try:
+                with self.limiter.slot() as slot:
+                    try:
+                        response = self._send(method, url, data)
+                    except requests.exceptions.Timeout:
+                        slot.outcome = TIMEOUT
+                        raise
+                    
+                    if response.status_code == 429:
+                        slot.outcome = THROTTLED
+                
+                if response.status_code == 429 and attempt < MAX_THROTTLE_RETRIES:
+                    # The limiter has already cut concurrency; back off and retry
+                    retry_after = response.headers.get('Retry-After', '')
+                    time.sleep(int(retry_after) if retry_after.isdigit() else 2 ** attempt)
+                    continue
+                
+                response.raise_for_status()
+                if response.status_code == 204:
+                    # Kommo answers an empty result page with No Content
+                    return {}
+                return response.json()
+            except requests.exceptions.RequestException as e:
+                if raise_errors:
+                    raise
+                print(f"API request failed: {e}")
+                return {}
     
     def get_pipelines(self) -> List[Dict]:
         """Get all pipelines"""
@@ -48,7 +86,7 @@ class KommoClient:
         
         while True:
             params['page'] = page
-            response = self._make_request('GET', f"leads?filter[pipeline_id]={pipeline_id}&limit={limit}&page={page}")
+            response = self._make_request('GET', f"leads?filter[pipeline_id]={pipeline_id}&limit={limit}&page={page}&with=contacts")
             
             leads = response.get('_embedded', {}).get('leads', [])
             if not leads:
@@ -75,6 +113,56 @@ class KommoClient:
         
         return all_leads
     
+    def _get_by_ids(self, entity: str, ids: List[int], batch_size: int = 50, extra_query: str = '') -> List[Dict]:
+        """Fetch leads/contacts/companies in bulk using filter[id][]"""
+        results = []
+        ids = list(ids)
+        
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            id_filter = '&'.join(f"filter[id][]={entity_id}" for entity_id in batch)
+            response = self._make_request('GET', f"{entity}?{id_filter}&limit=250{extra_query}")
+            results.extend(response.get('_embedded', {}).get(entity, []))
+        
+        return results
+    
+    def get_leads_by_ids(self, lead_ids: List[int]) -> List[Dict]:
+        """Get leads (with linked contacts) by ID in batches"""
+        return self._get_by_ids('leads', lead_ids, extra_query='&with=contacts')
+    
+    def get_contacts_by_ids(self, contact_ids: List[int]) -> List[Dict]:
+        """Get contacts by ID in batches"""
+        return self._get_by_ids('contacts', contact_ids)
+    
+    def get_companies_by_ids(self, company_ids: List[int]) -> List[Dict]:
+        """Get companies by ID in batches"""
+        return self._get_by_ids('companies', company_ids)
+    
+    def get_updated_since(self, entity: str, timestamp: int, limit: int = 250) -> List[Dict]:
+        """Get all contacts/companies modified since a Unix timestamp.
+
+        Raises requests.RequestException if a page cannot be fetched, since a
+        partial result would silently skip changes.
+        """
+        all_items = []
+        page = 1
+        
+        while True:
+            response = self._make_request('GET', f"{entity}?filter[updated_at][from]={timestamp}&limit={limit}&page={page}",
+                                          raise_errors=True)
+            
+            items = response.get('_embedded', {}).get(entity, [])
+            if not items:
+                break
+            
+            all_items.extend(items)
+            page += 1
+            
+            if len(items) < limit:
+                break
+        
+        return all_items
+    
     def update_lead(self, lead_id: int, data: Dict) -> Dict:
         """Update a lead"""
         return self._make_request('PATCH', f'leads/{lead_id}', data)
@@ -101,6 +189,22 @@ class KommoClient:
         
         return self.update_lead(lead_id, update_data)
     
+    def set_score_tag(self, lead_id: int, score: int) -> Dict:
+        """Replace any AI_Score_N tags on a lead with AI_Score_<score>"""
+        lead_data = self._make_request('GET', f'leads/{lead_id}')
+        if not lead_data:
+            return {}
+        
+        # Keep every other tag; old score tags would contradict the new one
+        current_tags = lead_data.get('_embedded', {}).get('tags', [])
+        tag_names = [
+            tag.get('name') for tag in current_tags
+            if not SCORE_TAG_PATTERN.match(tag.get('name') or '')
+        ]
+        tag_names.append(f"AI_Score_{score}")
+        
+        return self.update_lead(lead_id, {'tags': tag_names})
+    
     def move_lead_to_pipeline(self, lead_id: int, pipeline_id: int, status_id: int) -> Dict:
         """Move a lead to a different pipeline and status"""
         update_data = {
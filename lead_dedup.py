@@ -0,0 +1,94 @@
+import random
+import re
+import zlib
+from typing import List
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Lines that differ between otherwise identical imported leads
+_VOLATILE_LINES = re.compile(r'^\s*-\s*(Created|Updated):.*$', re.MULTILINE)
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    """Word n-grams of the lead text, ignoring timestamps"""
+    words = re.findall(r'\w+', _VOLATILE_LINES.sub('', text).lower())
+    if len(words) < size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class LeadDeduplicator:
+    """Group near-identical leads with MinHash signatures and LSH banding.
+
+    Each lead is compared only against cluster representatives that share at
+    least one LSH band bucket with it, so the cost per lead does not grow with
+    the number of leads already seen.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 num_perm: int = NUM_PERMUTATIONS, bands: int = NUM_BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = random.Random(1)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, text: str) -> List[int]:
+        """MinHash signature of a lead's text"""
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in _shingles(text)]
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        ]
+
+    def similarity(self, sig_a: List[int], sig_b: List[int]) -> float:
+        """Estimated Jaccard similarity of two signatures"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / self.num_perm
+
+    def cluster(self, texts: List[str]) -> List[int]:
+        """Return, for each text, the index of its cluster representative"""
+        buckets = [{} for _ in range(self.bands)]
+        signatures = []
+        representatives = []
+
+        for i, text in enumerate(texts):
+            sig = self.signature(text)
+            signatures.append(sig)
+            band_keys = [
+                tuple(sig[band * self.rows:(band + 1) * self.rows])
+                for band in range(self.bands)
+            ]
+
+            candidates = set()
+            for band, key in enumerate(band_keys):
+                candidates.update(buckets[band].get(key, ()))
+
+            best, best_similarity = None, self.threshold
+            for candidate in candidates:
+                candidate_similarity = self.similarity(sig, signatures[candidate])
+                if candidate_similarity >= best_similarity:
+                    best, best_similarity = candidate, candidate_similarity
+
+            if best is not None:
+                representatives.append(best)
+                continue
+
+            # New cluster: only representatives are indexed
+            representatives.append(i)
+            for band, key in enumerate(band_keys):
+                buckets[band].setdefault(key, []).append(i)
+
+        return representatives
@@ -1,17 +1,67 @@
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional
 from kommo_client import KommoClient
 from ai_scorer import AILeadScorer
-import time
+from contact_enricher import ContactEnricher
+from score_store import ScoreStore, DEFAULT_STORE_PATH, HIGH_SCORE_THRESHOLD, score_from_tags
+from scoring_scheduler import ScoringScheduler
+from results_store import ResultsStore, DEFAULT_RESULTS_PATH
+from profiling import NullProfiler, RunProfiler, profiled_run, propagate
+
+def _pipeline_id(lead: Dict):
+    pipeline = lead.get('pipeline') if isinstance(lead.get('pipeline'), dict) else {}
+    return lead.get('pipeline_id') or pipeline.get('id')
 
 class LeadProcessor:
-    def __init__(self):
-        self.kommo_client = KommoClient()
-        self.ai_scorer = AILeadScorer()
+    def __init__(self, store_path: str = DEFAULT_STORE_PATH, results_path: str = DEFAULT_RESULTS_PATH,
+                 kommo_base_url: Optional[str] = None, kommo_api_key: Optional[str] = None,
+                 openai_api_key: Optional[str] = None):
+        self.kommo_client = KommoClient(kommo_base_url, kommo_api_key)
+        self.ai_scorer = AILeadScorer(api_key=openai_api_key)
+        self.score_store = ScoreStore(store_path)
+        self.results_store = ResultsStore(results_path)
+        self.contact_enricher = ContactEnricher(self.kommo_client)
+        self.profiler = NullProfiler()
+        # Scored leads recorded with save=False, written to the results store by flush()
+        self.unsaved_results = []
+    
+    def close(self):
+        """Release API clients and background threads"""
+        self.ai_scorer.close()
+    
+    def enable_profiling(self, output_dir: str = "profiles"):
+        """Profile subsequent runs; writes collapsed stacks and per-stage timings to output_dir"""
+        self.profiler = RunProfiler(output_dir)
     
+    def disable_profiling(self):
+        """Turn profiling off"""
+        self.profiler = NullProfiler()
+    
+    def _map_kommo(self, func: Callable, items: List) -> List:
+        """Run Kommo calls concurrently; the client's adaptive limiter paces them"""
+        if not items:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(self.kommo_client.limiter.max_limit, len(items))) as executor:
+            return list(executor.map(propagate(func), items))
+    
+    def get_resilience_stats(self) -> Dict:
+        """OpenAI hedging and circuit breaker activity"""
+        return self.ai_scorer.get_resilience_stats()
+    
+    def get_concurrency_stats(self) -> Dict:
+        """Current adaptive concurrency limits for Kommo and OpenAI"""
+        return {
+            "kommo": self.kommo_client.limiter.stats(),
+            "openai": self.ai_scorer.limiter.stats()
+        }
+    
+    @profiled_run('process')
     def process_all_leads(self) -> Dict:
         """Process all leads: score them and add tags"""
         print("Fetching all leads from all pipelines...")
-        all_leads = self.kommo_client.get_all_leads()
+        with self.profiler.stage('fetch'):
+            all_leads = self.kommo_client.get_all_leads()
         
         if not all_leads:
             return {"error": "No leads found"}
@@ -19,49 +69,203 @@ class LeadProcessor:
         print(f"Found {len(all_leads)} leads to process")
         
         # Score all leads
+        print("Fetching contact data for leads...")
+        with self.profiler.stage('enrich'):
+            self.contact_enricher.enrich(all_leads)
+        
         print("Scoring leads with AI...")
-        scored_leads = self.ai_scorer.batch_score_leads(all_leads)
+        with self.profiler.stage('score'):
+            scored_leads = self.ai_scorer.batch_score_leads(
+                all_leads, with_reasons=False, reason_threshold=HIGH_SCORE_THRESHOLD
+            )
+        with self.profiler.stage('store'):
+            self.score_store.record_scored_leads(scored_leads)
+            self.results_store.write(scored_leads)
         
         # Add score tags to leads
         print("Adding score tags to leads...")
-        tagged_count = 0
-        high_score_leads = []
+        tagged_count = self.tag_leads(scored_leads)
         
-        for lead in scored_leads:
-            lead_id = lead.get('id')
-            score = lead.get('ai_score', 0)
-            
-            # Add score tag
-            tag_name = f"AI_Score_{score}"
-            result = self.kommo_client.add_tag_to_lead(lead_id, tag_name)
-            
-            if result:
-                tagged_count += 1
-                print(f"Added tag '{tag_name}' to lead {lead_id}")
-            
-            # Collect high-scoring leads (score >= 5)
-            if score >= 5:
-                high_score_leads.append(lead)
-            
-            # Small delay to avoid rate limiting
-            time.sleep(0.1)
+        # Collect high-scoring leads (score >= 5)
+        high_score_leads = [lead for lead in scored_leads if lead.get('ai_score', 0) >= 5]
         
         return {
             "total_leads": len(all_leads),
             "tagged_leads": tagged_count,
             "high_score_leads": high_score_leads,
-            "high_score_count": len(high_score_leads)
+            "high_score_count": len(high_score_leads),
+            "parked_leads": len(all_leads) - len(scored_leads)
+        }
+    
+    @profiled_run('tag')
+    def tag_leads(self, scored_leads: List[Dict], save: bool = True) -> int:
+        """Set the AI_Score_N tag on scored leads that do not already carry exactly their current score"""
+        to_tag = [lead for lead in scored_leads if score_from_tags(lead) != lead.get('ai_score')]
+        
+        with self.profiler.stage('tag'):
+            results = self._map_kommo(
+                lambda lead: self.kommo_client.set_score_tag(lead.get('id'), lead.get('ai_score', 0)),
+                to_tag
+            )
+        
+        tagged_count = 0
+        for lead, result in zip(to_tag, results):
+            if result:
+                tagged_count += 1
+                self.score_store.touch(lead.get('id'), result.get('updated_at'))
+                print(f"Set tag 'AI_Score_{lead.get('ai_score', 0)}' to lead {lead.get('id')}")
+        
+        if save:
+            self.score_store.save()
+        return tagged_count
+    
+    @profiled_run('sync')
+    def sync_scores_from_tags(self) -> Dict:
+        """Import existing AI_Score_N tags from Kommo into the score store"""
+        with self.profiler.stage('fetch'):
+            all_leads = self.kommo_client.get_all_leads()
+        
+        imported = 0
+        for lead in all_leads:
+            score = score_from_tags(lead)
+            if score is not None and self.score_store.get(lead.get('id')) is None:
+                self.score_store.record(lead, score)
+                imported += 1
+        
+        self.score_store.save()
+        return {
+            "total_leads": len(all_leads),
+            "imported_scores": imported,
+            "stored_scores": len(self.score_store.scores)
+        }
+    
+    @profiled_run('resolve')
+    def resolve_scores(self, leads: List[Dict], rescore: bool = True, save: bool = True) -> List[Dict]:
+        """Attach ai_score to leads from persisted scores or existing AI_Score tags.
+
+        Only leads with no known score or a stale one are sent to the AI (or
+        skipped when rescore is False). With save=False new scores are only
+        kept in memory until flush().
+        """
+        resolved = []
+        to_score = []
+        imported = 0
+        # Pick up scores saved by other processes (e.g. the CLI run from cron)
+        self.score_store.refresh()
+        
+        for lead in leads:
+            score = self.score_store.resolve_score(lead)
+            if score is None:
+                to_score.append(lead)
+                continue
+            
+            entry = self.score_store.get(lead.get('id'))
+            lead_with_score = lead.copy()
+            lead_with_score['ai_score'] = score
+            if entry:
+                # Stored scores may have no reason yet (see get_reason)
+                lead_with_score['ai_reason'] = entry.get('reason')
+            else:
+                # Keep tag scores in the store so the summary includes them
+                self.score_store.record(lead, score)
+                imported += 1
+                lead_with_score['ai_reason'] = 'Score from existing AI_Score tag'
+            resolved.append(lead_with_score)
+        
+        if imported and save:
+            self.score_store.save()
+        
+        if to_score and rescore:
+            print(f"Re-scoring {len(to_score)} leads with no or stale scores...")
+            with self.profiler.stage('enrich'):
+                self.contact_enricher.enrich(to_score)
+            with self.profiler.stage('score'):
+                scored_leads = self.ai_scorer.batch_score_leads(
+                    to_score, with_reasons=False, reason_threshold=HIGH_SCORE_THRESHOLD
+                )
+            with self.profiler.stage('store'):
+                self.score_store.record_scored_leads(scored_leads, save=save)
+                if save:
+                    self.results_store.write(scored_leads)
+                else:
+                    self.unsaved_results.extend(scored_leads)
+            resolved.extend(scored_leads)
+        
+        return resolved
+    
+    def flush(self):
+        """Persist scores and results recorded with save=False"""
+        with self.profiler.stage('store'):
+            self.score_store.save()
+            self.results_store.write(self.unsaved_results)
+        self.unsaved_results = []
+    
+    def get_reason(self, lead_id: int) -> Optional[str]:
+        """Return the reason for a stored score, generating and saving it on first request.
+
+        Raises if the reason cannot be generated (e.g. OpenAI errors).
+        """
+        entry = self.score_store.get(lead_id)
+        if not entry:
+            return None
+        if entry.get('reason'):
+            return entry['reason']
+        
+        leads = self.kommo_client.get_leads_by_ids([lead_id])
+        if not leads:
+            return None
+        
+        lead = leads[0]
+        self.contact_enricher.enrich([lead])
+        reason = self.ai_scorer.generate_reason(lead, entry.get('score'))
+        
+        self.score_store.set_reason(lead_id, reason)
+        self.score_store.save()
+        self.results_store.record_reason(lead.get('id'), reason)
+        return reason
+    
+    @profiled_run('retry')
+    def retry_parked_leads(self) -> Dict:
+        """Score leads that were parked while OpenAI was failing"""
+        parked = self.ai_scorer.take_parked_leads()
+        scored_leads = self.resolve_scores(parked) if parked else []
+        return {
+            "retried_leads": len(parked),
+            "scored_leads": scored_leads,
+            "still_parked": len(self.ai_scorer.parked_leads)
         }
     
-    def move_high_score_leads(self, target_pipeline_id: int, target_status_id: int = None) -> Dict:
-        """Move high-scoring leads (score >= 5) to target pipeline"""
-        print("Processing leads to find high-scoring ones...")
-        result = self.process_all_leads()
+    @profiled_run('score')
+    def score_with_budget(self, leads: List[Dict], max_leads: int = None,
+                          on_chunk: Callable[[List[Dict]], None] = None, **scheduler_options) -> Dict:
+        """Score leads in priority order within a budget/deadline (see ScoringScheduler)"""
+        self.score_store.refresh()
+        scheduler = ScoringScheduler(self.ai_scorer, self.score_store, **scheduler_options)
+        
+        candidates = scheduler.order(leads)
+        if max_leads is not None:
+            candidates = candidates[:max_leads]
+        with self.profiler.stage('enrich'):
+            self.contact_enricher.enrich(candidates)
+        
+        with self.profiler.stage('score'):
+            run = scheduler.run(candidates, on_chunk=on_chunk)
+        with self.profiler.stage('store'):
+            self.results_store.write(run['scored_leads'])
+        return run
+    
+    @profiled_run('move')
+    def move_high_score_leads(self, target_pipeline_id: int, target_status_id: int = None, rescore: bool = True) -> Dict:
+        """Move high-scoring leads (score >= 5) to target pipeline using persisted scores"""
+        print("Fetching leads to find high-scoring ones...")
+        with self.profiler.stage('fetch'):
+            all_leads = self.kommo_client.get_all_leads()
         
-        if "error" in result:
-            return result
+        if not all_leads:
+            return {"error": "No leads found"}
         
-        high_score_leads = result["high_score_leads"]
+        scored_leads = self.resolve_scores(all_leads, rescore=rescore)
+        high_score_leads = [lead for lead in scored_leads if lead.get('ai_score', 0) >= 5]
         
         if not high_score_leads:
             return {"message": "No high-scoring leads found"}
@@ -74,45 +278,45 @@ class LeadProcessor:
             else:
                 return {"error": "Could not find statuses for target pipeline"}
         
-        moved_count = 0
-        
-        for lead in high_score_leads:
-            lead_id = lead.get('id')
-            current_pipeline = lead.get('pipeline', {}).get('id')
-            
-            # Only move if not already in target pipeline
-            if current_pipeline != target_pipeline_id:
-                result = self.kommo_client.move_lead_to_pipeline(
-                    lead_id, 
-                    target_pipeline_id, 
-                    target_status_id
-                )
-                
-                if result:
-                    moved_count += 1
-                    print(f"Moved lead {lead_id} to pipeline {target_pipeline_id}")
-                
-                # Small delay to avoid rate limiting
-                time.sleep(0.1)
+        moved_ids = self.move_leads(high_score_leads, target_pipeline_id, target_status_id)
         
         return {
-            "moved_leads": moved_count,
+            "moved_leads": len(moved_ids),
             "total_high_score": len(high_score_leads),
             "target_pipeline": target_pipeline_id
         }
     
-    def get_lead_scores_summary(self) -> Dict:
-        """Get a summary of lead scores"""
-        all_leads = self.kommo_client.get_all_leads()
-        scored_leads = self.ai_scorer.batch_score_leads(all_leads)
+    def move_leads(self, leads: List[Dict], target_pipeline_id: int, target_status_id: int) -> List[int]:
+        """Move leads concurrently (skipping those already in the target pipeline); returns moved IDs"""
+        moved_ids = []
         
-        score_distribution = {}
-        for lead in scored_leads:
-            score = lead.get('ai_score', 0)
-            score_distribution[score] = score_distribution.get(score, 0) + 1
+        # Only move if not already in target pipeline
+        leads_to_move = [
+            lead for lead in leads
+            if _pipeline_id(lead) != target_pipeline_id
+        ]
+        with self.profiler.stage('move'):
+            results = self._map_kommo(
+                lambda lead: self.kommo_client.move_lead_to_pipeline(lead.get('id'), target_pipeline_id, target_status_id),
+                leads_to_move
+            )
         
-        return {
-            "total_leads": len(scored_leads),
-            "score_distribution": score_distribution,
-            "high_score_leads": [lead for lead in scored_leads if lead.get('ai_score', 0) >= 5]
-        }
+        for lead, result in zip(leads_to_move, results):
+            lead_id = lead.get('id')
+            if result:
+                moved_ids.append(lead_id)
+                self.score_store.record_move(lead_id, target_pipeline_id, target_status_id)
+                self.score_store.touch(lead_id, result.get('updated_at'))
+                print(f"Moved lead {lead_id} to pipeline {target_pipeline_id}")
+        
+        with self.profiler.stage('store'):
+            self.score_store.save()
+            self.results_store.record_moves(moved_ids, target_pipeline_id, target_status_id)
+        
+        return moved_ids
+    
+    def get_lead_scores_summary(self) -> Dict:
+        """Get a summary of lead scores from the persisted, incrementally maintained store"""
+        summary = self.score_store.get_summary()
+        summary["high_score_leads"] = self.score_store.get_high_score_leads()
+        return summary
@@ -0,0 +1,228 @@
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+DEFAULT_SAMPLE_INTERVAL = 0.005  # seconds
+
+# The run the current thread is working for (set by RunProfiler.run and propagate)
+_active_run = contextvars.ContextVar('active_profiling_run', default=None)
+
+
+def profiled_run(name: str):
+    """Decorator for methods of objects with a `profiler` attribute"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.run(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func: Callable) -> Callable:
+    """Wrap func so worker threads running it are profiled as part of the caller's run.
+
+    Call this in the submitting thread, e.g. executor.map(propagate(func), items).
+    Without an active run func is returned unchanged.
+    """
+    run = _active_run.get()
+    if run is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run.enter_thread()
+        token = _active_run.set(run)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _active_run.reset(token)
+            run.leave_thread()
+    return wrapper
+
+
+class NullProfiler:
+    """Profiler used when profiling is off; every hook is a no-op"""
+
+    enabled = False
+
+    @contextmanager
+    def run(self, name: str):
+        yield
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+
+class _Run:
+    """State of one profiled run: its threads, per-thread stage stacks and samples"""
+
+    def __init__(self, profiler: 'RunProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+        self.owner = threading.get_ident()
+        self.depth = 1
+        self.started = time.monotonic()
+        self.last_switch = self.started
+
+        # Thread id -> number of active propagate() wrappers (the owner is always in)
+        self.threads = {self.owner: 1}
+        # Thread id -> stage stack; only the owner's stack is used for wall time
+        self.stages = {self.owner: [name]}
+        self.stage_times = {}
+        self.stage_samples = {}
+        self.stacks = {}
+
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.sampler = threading.Thread(target=self._sample_loop, name=f'run-profiler-{name}', daemon=True)
+
+    def enter_thread(self):
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.threads[thread_id] = self.threads.get(thread_id, 0) + 1
+
+    def leave_thread(self):
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.threads[thread_id] -= 1
+            if not self.threads[thread_id]:
+                del self.threads[thread_id]
+                self.stages.pop(thread_id, None)
+
+    def switch(self, push: Optional[str] = None, pop: bool = False):
+        thread_id = threading.get_ident()
+        now = time.monotonic()
+        with self.lock:
+            stack = self.stages.setdefault(thread_id, [])
+            if thread_id == self.owner and stack:
+                # Exclusive time: the stage on top of the owner's stack gets the elapsed time
+                current = stack[-1]
+                self.stage_times[current] = self.stage_times.get(current, 0.0) + now - self.last_switch
+                self.last_switch = now
+            if pop and stack:
+                stack.pop()
+            if push:
+                stack.append(push)
+
+    def _stage_of(self, thread_id: int) -> str:
+        # Workers without a stage of their own work for the owner's current stage
+        stack = self.stages.get(thread_id) or self.stages.get(self.owner)
+        return stack[-1] if stack else 'idle'
+
+    def _sample_loop(self):
+        while not self.stop.wait(self.profiler.sample_interval):
+            frames = sys._current_frames()
+            with self.lock:
+                labels = {thread_id: self._stage_of(thread_id) for thread_id in self.threads}
+            for thread_id, stage in labels.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                key = ';'.join([stage] + stack[::-1])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.stage_samples[stage] = self.stage_samples.get(stage, 0) + 1
+
+
+class RunProfiler:
+    """Sampling profiler with per-stage wall-time breakdown.
+
+    Each run belongs to the thread that started it, plus the worker threads
+    it hands work to through propagate(). A sampler thread per run samples
+    only those threads and prefixes their stacks with the current stage
+    (fetch/enrich/score/tag/move/...), so concurrent runs on a shared
+    processor (e.g. two UI sessions) do not mix. When the outermost run
+    finishes it writes a collapsed-stack file usable by flamegraph.pl or
+    speedscope, and a JSON file with exclusive wall time per stage.
+    """
+
+    enabled = True
+
+    def __init__(self, output_dir: str = "profiles", sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.last_report = None
+
+    def _current(self) -> Optional[_Run]:
+        run = _active_run.get()
+        return run if run is not None and run.profiler is self else None
+
+    @contextmanager
+    def run(self, name: str):
+        """Profile a whole run; nested runs are folded into the outermost one"""
+        run = self._current()
+        if run is not None:
+            run.depth += 1
+            try:
+                yield
+            finally:
+                run.depth -= 1
+            return
+
+        run = _Run(self, name)
+        token = _active_run.set(run)
+        run.sampler.start()
+        try:
+            yield
+        finally:
+            _active_run.reset(token)
+            run.stop.set()
+            run.sampler.join()
+            run.switch(pop=True)
+            self.last_report = self._write(run)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Attribute time and samples inside the block to a stage"""
+        run = self._current()
+        if run is None:
+            yield
+            return
+
+        run.switch(push=name)
+        try:
+            yield
+        finally:
+            run.switch(pop=True)
+
+    def _write(self, run: _Run) -> Dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Thread id keeps concurrent runs started in the same second apart
+        prefix = os.path.join(self.output_dir, f"{run.name}-{time.strftime('%Y%m%d-%H%M%S')}-{run.owner}")
+
+        with open(f"{prefix}.folded", 'w', encoding='utf-8') as f:
+            for stack, count in sorted(run.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        total = time.monotonic() - run.started
+        report = {
+            'run': run.name,
+            'wall_seconds': total,
+            'sample_interval': self.sample_interval,
+            'stages': {
+                stage: {
+                    'seconds': seconds,
+                    'percent': seconds / total * 100 if total else 0,
+                    'samples': run.stage_samples.get(stage, 0)
+                }
+                for stage, seconds in sorted(run.stage_times.items(), key=lambda item: -item[1])
+            },
+            'folded_file': f"{prefix}.folded"
+        }
+        with open(f"{prefix}-stages.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        print(f"Profile written to {prefix}.folded and {prefix}-stages.json")
+        return report
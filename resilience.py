@@ -0,0 +1,222 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+from profiling import propagate
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Latency percentile, or None until enough samples were seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected for reset_timeout seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+        self.opens = 0
+        self.rejected = 0
+
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be made now (counts a rejection if not)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected"""
+        return self.retry_in() > 0
+
+    def retry_in(self) -> float:
+        """Seconds until a trial call will be let through (0 unless open)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opens += 1
+                    print(f"Circuit '{self.name}' opened after {self.consecutive_failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'opens': self.opens,
+                'rejected': self.rejected
+            }
+
+
+class HedgedCaller:
+    """Race a duplicate call when the first one is slower than usual.
+
+    Calls are made as func(hedge, on_start): func calls on_start() right
+    before the actual request (after any queueing, e.g. for a limiter slot),
+    so the tracked latency and the hedge delay cover only the request. If
+    the primary request has not returned after the tracked latency
+    percentile, func(True, ...) is issued and whichever succeeds first wins.
+    A loser that has not started yet is cancelled; one already in flight
+    cannot be aborted and its result is discarded. Hedges are capped at
+    max_hedge_ratio of all calls so a slow upstream does not get twice the
+    load, and run on their own small pool so they never queue behind
+    primaries that are still waiting for a slot.
+    """
+
+    def __init__(self, name: str, max_workers: int = 64, hedge_workers: int = 8, hedge_percentile: float = 95,
+                 max_hedge_ratio: float = 0.1, latency: Optional[LatencyTracker] = None):
+        self.name = name
+        self.hedge_percentile = hedge_percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.latency = latency or LatencyTracker()
+
+        self.calls = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix=f"{name}-hedge")
+        self._lock = threading.Lock()
+
+    def _attempt(self, func: Callable, hedge: bool, started: threading.Event, abandoned: threading.Event):
+        if abandoned.is_set():
+            raise CancelledError()
+
+        request_started = []
+
+        def on_start():
+            if abandoned.is_set():
+                # The other attempt already won; do not send this request
+                raise CancelledError()
+            request_started.append(time.monotonic())
+            started.set()
+
+        result = func(hedge, on_start)
+        if request_started:
+            self.latency.record(time.monotonic() - request_started[0])
+        return result
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges_issued + 1 > self.calls * self.max_hedge_ratio:
+                return False
+            self.hedges_issued += 1
+            return True
+
+    def call(self, func: Callable):
+        """Run func(hedge, on_start) (hedged if slow) and return the first successful result"""
+        with self._lock:
+            self.calls += 1
+        delay = self.latency.percentile(self.hedge_percentile)
+
+        attempt = propagate(self._attempt)
+        primary_started = threading.Event()
+        abandoned = threading.Event()
+        primary = self._executor.submit(attempt, func, False, primary_started, abandoned)
+        pending = {primary}
+        if delay is not None:
+            # Queueing before the request starts is not upstream latency
+            primary.add_done_callback(lambda _: primary_started.set())
+            primary_started.wait()
+            done, _ = wait(pending, timeout=delay)
+            if not done and self._may_hedge():
+                pending.add(self._hedge_executor.submit(attempt, func, True, threading.Event(), abandoned))
+
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            with self._lock:
+                                self.hedges_won += 1
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            abandoned.set()
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        """Stop the call and hedge threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._hedge_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'calls': self.calls,
+                'hedges_issued': self.hedges_issued,
+                'hedges_won': self.hedges_won,
+                'hedge_delay': self.latency.percentile(self.hedge_percentile)
+            }
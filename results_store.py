@@ -0,0 +1,229 @@
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DEFAULT_RESULTS_PATH = "scored_results.arrow"
+
+# Appended parts are merged into the main file once there are this many
+MAX_PARTS = 16
+
+RESULTS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('company_name', pa.string()),
+    ('ai_score', pa.int64()),
+    ('ai_reason', pa.string()),
+    ('pipeline_id', pa.int64()),
+    ('pipeline_name', pa.string()),
+    ('status_id', pa.int64()),
+    ('status_name', pa.string()),
+    ('price', pa.float64()),
+    ('scored_at', pa.int64())
+])
+
+
+def _to_row(lead: Dict, scored_at: int) -> Dict:
+    pipeline = lead.get('pipeline') if isinstance(lead.get('pipeline'), dict) else {}
+    status = lead.get('status') if isinstance(lead.get('status'), dict) else {}
+    return {
+        'id': lead.get('id'),
+        'name': lead.get('name') or '',
+        'company_name': lead.get('company_name') or '',
+        'ai_score': lead.get('ai_score'),
+        'ai_reason': lead.get('ai_reason'),
+        'pipeline_id': lead.get('pipeline_id') or pipeline.get('id'),
+        'pipeline_name': pipeline.get('name') or '',
+        'status_id': lead.get('status_id') or status.get('id'),
+        'status_name': status.get('name') or '',
+        'price': float(lead.get('price') or 0),
+        'scored_at': scored_at
+    }
+
+
+def _write_ipc(path: str, table: pa.Table):
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, RESULTS_SCHEMA) as writer:
+            writer.write_table(table.combine_chunks())
+    os.replace(tmp_path, path)
+
+
+class ResultsStore:
+    """Scored leads in Arrow IPC files, memory-mapped on read.
+
+    New results are appended as small part files next to the main file, so
+    a write costs only its own rows; on read the latest row per lead wins,
+    and parts are merged into the main file once there are MAX_PARTS of
+    them. Queries filter, sort and slice the table with Arrow compute
+    kernels, so callers only ever materialize one page of rows.
+    """
+
+    def __init__(self, path: str = DEFAULT_RESULTS_PATH):
+        self.path = path
+        self.parts_dir = f"{path}.parts"
+        self._sources = []
+        self._table = None
+        self._signature = None
+        # Part files merged into the cached table; only these may be deleted on compaction
+        self._table_parts = []
+
+    def _part_paths(self) -> List[str]:
+        if not os.path.isdir(self.parts_dir):
+            return []
+        # Names start with a fixed-width timestamp, so sorting gives write order
+        return [os.path.join(self.parts_dir, name) for name in sorted(os.listdir(self.parts_dir))
+                if name.endswith('.arrow')]
+
+    def table(self) -> pa.Table:
+        """All results (memory-mapped; re-opened when the files change)"""
+        while True:
+            parts = self._part_paths()
+            files = ([self.path] if os.path.exists(self.path) else []) + parts
+            if not files:
+                return RESULTS_SCHEMA.empty_table()
+
+            try:
+                signature = tuple((path, os.path.getmtime(path)) for path in files)
+                if self._table is not None and signature == self._signature:
+                    return self._table
+                # Column buffers point into the mappings; keep them open with the table
+                sources = [pa.memory_map(path, 'r') for path in files]
+                tables = [pa.ipc.open_file(source).read_all() for source in sources]
+            except FileNotFoundError:
+                # Another process compacted the parts meanwhile; list the files again
+                continue
+
+            table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+            if parts:
+                table = self._latest_per_id(table)
+            self._sources = sources
+            self._table = table
+            self._signature = signature
+            self._table_parts = parts
+            return table
+
+    @staticmethod
+    def _latest_per_id(table: pa.Table) -> pa.Table:
+        # Rows are in write order; keep the last one of each lead
+        positions = table.append_column('_row', pa.array(range(table.num_rows), pa.int64()))
+        latest = positions.group_by('id').aggregate([('_row', 'max')])['_row_max']
+        return table.take(pc.take(latest, pc.sort_indices(latest)))
+
+    def _replace(self, table: pa.Table):
+        """Write table (built by table()) as the main file and drop the parts it merged.
+
+        Parts written after table() was read are kept, so a concurrent
+        writer's rows are not lost.
+        """
+        merged_parts = self._table_parts
+        _write_ipc(self.path, table)
+        for path in merged_parts:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._table = None
+        self._table_parts = []
+
+    def write(self, scored_leads: List[Dict]):
+        """Add or replace results for the given scored leads (appends a part file)"""
+        if not scored_leads:
+            return
+
+        scored_at = int(time.time())
+        new_rows = pa.Table.from_pylist([_to_row(lead, scored_at) for lead in scored_leads], schema=RESULTS_SCHEMA)
+
+        os.makedirs(self.parts_dir, exist_ok=True)
+        _write_ipc(os.path.join(self.parts_dir, f"{time.time_ns():020d}.arrow"), new_rows)
+        self._table = None
+
+        if len(self._part_paths()) >= MAX_PARTS:
+            self._replace(self.table())
+
+    def record_moves(self, lead_ids: List[int], pipeline_id: int, status_id: int):
+        """Update pipeline/status of moved leads"""
+        table = self.table()
+        if not lead_ids or not table.num_rows:
+            return
+
+        moved = pc.is_in(table['id'], value_set=pa.array(lead_ids, pa.int64()))
+        columns = {
+            'pipeline_id': pc.if_else(moved, pa.scalar(pipeline_id, pa.int64()), table['pipeline_id']),
+            'pipeline_name': pc.if_else(moved, pa.scalar('', pa.string()), table['pipeline_name']),
+            'status_id': pc.if_else(moved, pa.scalar(status_id, pa.int64()), table['status_id']),
+            'status_name': pc.if_else(moved, pa.scalar('', pa.string()), table['status_name'])
+        }
+        for name, column in columns.items():
+            table = table.set_column(table.schema.get_field_index(name), name, column)
+
+        self._replace(table)
+
+    def record_reason(self, lead_id: int, reason: str):
+        """Fill in the reason of one result (reasons are generated lazily)"""
+        table = self.table()
+        if not table.num_rows:
+            return
+
+        matches = pc.equal(table['id'], pa.scalar(lead_id, pa.int64()))
+        column = pc.if_else(matches, pa.scalar(reason, pa.string()), table['ai_reason'])
+        self._replace(table.set_column(table.schema.get_field_index('ai_reason'), 'ai_reason', column))
+
+    def _filter(self, min_score: Optional[int], max_score: Optional[int],
+                pipeline_ids: Optional[List[int]], status_ids: Optional[List[int]]) -> pa.Table:
+        table = self.table()
+
+        conditions = []
+        if min_score is not None:
+            conditions.append(pc.greater_equal(table['ai_score'], min_score))
+        if max_score is not None:
+            conditions.append(pc.less_equal(table['ai_score'], max_score))
+        if pipeline_ids:
+            conditions.append(pc.is_in(table['pipeline_id'], value_set=pa.array(pipeline_ids, pa.int64())))
+        if status_ids:
+            conditions.append(pc.is_in(table['status_id'], value_set=pa.array(status_ids, pa.int64())))
+
+        if not conditions:
+            return table
+
+        mask = conditions[0]
+        for condition in conditions[1:]:
+            mask = pc.and_(mask, condition)
+        return table.filter(mask)
+
+    def count(self, min_score: Optional[int] = None, max_score: Optional[int] = None,
+              pipeline_ids: Optional[List[int]] = None, status_ids: Optional[List[int]] = None) -> int:
+        """Number of results matching the filters"""
+        return self._filter(min_score, max_score, pipeline_ids, status_ids).num_rows
+
+    def query(self, min_score: Optional[int] = None, max_score: Optional[int] = None,
+              pipeline_ids: Optional[List[int]] = None, status_ids: Optional[List[int]] = None,
+              sort_by: str = 'ai_score', descending: bool = True,
+              page: int = 1, page_size: int = 50) -> Tuple[List[Dict], int]:
+        """Return (rows of the requested page, total matching rows)"""
+        table = self._filter(min_score, max_score, pipeline_ids, status_ids)
+
+        total = table.num_rows
+        if not total:
+            return [], 0
+
+        # Sort only indices, then take the requested page
+        order = 'descending' if descending else 'ascending'
+        indices = pc.sort_indices(table, sort_keys=[(sort_by, order), ('id', 'ascending')])
+        start = max(0, (page - 1) * page_size)
+        page_rows = table.take(indices[start:start + page_size])
+        return page_rows.to_pylist(), total
+
+    def distinct(self, column: str) -> List:
+        """Distinct non-null values of a column (for filter options)"""
+        table = self.table()
+        if not table.num_rows:
+            return []
+        return sorted(value for value in pc.unique(table[column]).to_pylist() if value is not None)
+
+    def export_parquet(self, path: str):
+        """Write all results to a Parquet file"""
+        pq.write_table(self.table(), path)
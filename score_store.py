@@ -0,0 +1,311 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_STORE_PATH = "lead_scores.json"
+
+HIGH_SCORE_THRESHOLD = 5
+
+SCORE_TAG_PATTERN = re.compile(r'^AI_Score_(\d+)$')
+
+
+def score_from_tags(lead: Dict) -> Optional[int]:
+    """Return the score recorded in an existing AI_Score_N tag, if any.
+
+    Kommo does not keep tags in the order they were added, so a lead with
+    several AI_Score tags (tagged before old ones were removed) is unknown.
+    """
+    embedded = lead.get('_embedded', {}) or {}
+    tags = embedded.get('tags', []) or []
+
+    scores = []
+    for tag in tags:
+        if not tag:
+            continue
+        match = SCORE_TAG_PATTERN.match(tag.get('name', '') or '')
+        if match:
+            scores.append(int(match.group(1)))
+
+    return scores[0] if len(scores) == 1 else None
+
+
+def _pipeline_key(lead: Dict) -> str:
+    pipeline = lead.get('pipeline') if isinstance(lead.get('pipeline'), dict) else {}
+    return str(lead.get('pipeline_id') or pipeline.get('id') or 'Unknown')
+
+
+def _status_key(lead: Dict) -> str:
+    status = lead.get('status') if isinstance(lead.get('status'), dict) else {}
+    return str(lead.get('status_id') or status.get('id') or 'Unknown')
+
+
+def _empty_summary() -> Dict:
+    return {
+        'total': 0,
+        'score_sum': 0,
+        'by_score': {},
+        'by_pipeline': {},
+        'by_status': {},
+        'high_score_ids': set()
+    }
+
+
+class ScoreStore:
+    """Persisted last known AI score per lead ID.
+
+    The file may be written by other processes too (e.g. the CLI from cron
+    next to the app): refresh() picks up their changes, and save() merges
+    them first so our unsaved entries do not overwrite theirs. A lock keeps
+    the store consistent when one instance is shared by several threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self.scores = {}
+        self.summary = _empty_summary()
+        # Lead IDs changed in memory since the last save
+        self._dirty = set()
+        # (mtime, size) of the file as last loaded or saved
+        self._signature = None
+        self._lock = threading.RLock()
+        self.load()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load score store {self.path}: {e}")
+            return None
+
+    def load(self):
+        """Load persisted scores from disk"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return
+
+            signature = self._file_signature()
+            data = self._read()
+            if data is None:
+                self.scores = {}
+                return
+            self.scores = data.get('scores', {})
+            self._dirty = set()
+            self._signature = signature
+            summary = data.get('summary')
+
+            if summary:
+                summary['high_score_ids'] = set(summary.get('high_score_ids', []))
+                self.summary = summary
+            else:
+                # Store written before summaries existed: build it once
+                self.rebuild_summary()
+
+    def refresh(self):
+        """Merge in entries another process saved since we last loaded or saved"""
+        with self._lock:
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                return
+
+            data = self._read()
+            if data is None:
+                return
+            for lead_id, entry in data.get('scores', {}).items():
+                # Our unsaved changes win over what is on disk
+                if lead_id in self._dirty:
+                    continue
+                current = self.scores.get(lead_id)
+                if current == entry:
+                    continue
+                if current:
+                    self._count(lead_id, current, -1)
+                self.scores[lead_id] = entry
+                self._count(lead_id, entry, 1)
+            self._signature = signature
+
+    def save(self):
+        """Write scores and the summary to disk atomically, keeping other writers' entries"""
+        with self._lock:
+            self.refresh()
+
+            summary = dict(self.summary)
+            summary['high_score_ids'] = sorted(self.summary['high_score_ids'])
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                # dumps() encodes in one C call; dump() streams through the much slower chunked encoder
+                f.write(json.dumps({'scores': self.scores, 'summary': summary}))
+            os.replace(tmp_path, self.path)
+            self._dirty = set()
+            self._signature = self._file_signature()
+
+    def rebuild_summary(self):
+        """Recompute the summary from all stored entries"""
+        self.summary = _empty_summary()
+        for lead_id, entry in self.scores.items():
+            self._count(lead_id, entry, 1)
+
+    def _count(self, lead_id: str, entry: Dict, sign: int):
+        """Add (sign=1) or remove (sign=-1) an entry's contribution to the summary"""
+        summary = self.summary
+        score = entry.get('score') or 0
+        score_key = str(score)
+        is_high = score >= HIGH_SCORE_THRESHOLD
+
+        summary['total'] += sign
+        summary['score_sum'] += sign * score
+        summary['by_score'][score_key] = summary['by_score'].get(score_key, 0) + sign
+        if not summary['by_score'][score_key]:
+            del summary['by_score'][score_key]
+
+        pipeline_key = entry.get('pipeline', 'Unknown')
+        pipeline = summary['by_pipeline'].setdefault(pipeline_key, {'count': 0, 'score_sum': 0, 'high_score': 0})
+        pipeline['count'] += sign
+        pipeline['score_sum'] += sign * score
+        pipeline['high_score'] += sign if is_high else 0
+        if not pipeline['count']:
+            del summary['by_pipeline'][pipeline_key]
+
+        status_key = entry.get('status', 'Unknown')
+        summary['by_status'][status_key] = summary['by_status'].get(status_key, 0) + sign
+        if not summary['by_status'][status_key]:
+            del summary['by_status'][status_key]
+
+        if is_high and sign > 0:
+            summary['high_score_ids'].add(lead_id)
+        else:
+            summary['high_score_ids'].discard(lead_id)
+
+    def get(self, lead_id) -> Optional[Dict]:
+        """Get the stored entry for a lead"""
+        return self.scores.get(str(lead_id))
+
+    def is_fresh(self, lead: Dict) -> bool:
+        """Check whether the stored score still matches the lead's last update"""
+        entry = self.get(lead.get('id'))
+        if not entry:
+            return False
+
+        return (lead.get('updated_at') or 0) <= (entry.get('updated_at') or 0)
+
+    def record(self, lead: Dict, score: int, reason: Optional[str] = None):
+        """Store the score for a lead and update the summary (call save() to persist)"""
+        lead_id = str(lead.get('id'))
+        entry = {
+            'score': score,
+            'reason': reason,
+            'pipeline': _pipeline_key(lead),
+            'status': _status_key(lead),
+            'updated_at': lead.get('updated_at') or 0,
+            'scored_at': int(time.time())
+        }
+
+        with self._lock:
+            previous = self.scores.get(lead_id)
+            if previous:
+                self._count(lead_id, previous, -1)
+            self.scores[lead_id] = entry
+            self._count(lead_id, entry, 1)
+            self._dirty.add(lead_id)
+
+    def record_move(self, lead_id, pipeline_id, status_id):
+        """Update a scored lead's pipeline and status after it was moved"""
+        lead_id = str(lead_id)
+        with self._lock:
+            entry = self.scores.get(lead_id)
+            if not entry:
+                return
+
+            self._count(lead_id, entry, -1)
+            entry['pipeline'] = str(pipeline_id)
+            entry['status'] = str(status_id)
+            self._count(lead_id, entry, 1)
+            self._dirty.add(lead_id)
+
+    def touch(self, lead_id, updated_at):
+        """Advance the stored updated_at after we modified the lead ourselves.
+
+        Tagging or moving a lead bumps its updated_at in Kommo; without this
+        our own writes would make every stored score look stale.
+        """
+        with self._lock:
+            entry = self.get(lead_id)
+            if entry and updated_at:
+                entry['updated_at'] = max(entry.get('updated_at') or 0, updated_at)
+                self._dirty.add(str(lead_id))
+
+    def set_reason(self, lead_id, reason: str):
+        """Attach a lazily generated reason to a stored score"""
+        with self._lock:
+            entry = self.get(lead_id)
+            if entry:
+                entry['reason'] = reason
+                self._dirty.add(str(lead_id))
+
+    def record_scored_leads(self, scored_leads: List[Dict], save: bool = True):
+        """Store scores for a list of leads returned by batch_score_leads"""
+        with self._lock:
+            for lead in scored_leads:
+                self.record(lead, lead.get('ai_score', 0), lead.get('ai_reason'))
+            if save:
+                self.save()
+
+    def resolve_score(self, lead: Dict) -> Optional[int]:
+        """Return a known score for a lead without calling the AI.
+
+        A fresh stored score wins; otherwise an AI_Score_N tag is used as long
+        as the lead has no stale stored entry. Returns None when the lead needs
+        (re-)scoring.
+        """
+        if self.is_fresh(lead):
+            return self.get(lead.get('id')).get('score')
+
+        if self.get(lead.get('id')) is None:
+            return score_from_tags(lead)
+
+        return None
+
+    def get_summary(self) -> Dict:
+        """Score distribution, per-pipeline averages and per-status counts"""
+        with self._lock:
+            self.refresh()
+            summary = self.summary
+            total = summary['total']
+
+            by_pipeline = {}
+            for pipeline_key, data in summary['by_pipeline'].items():
+                by_pipeline[pipeline_key] = {
+                    'total': data['count'],
+                    'high_score': data['high_score'],
+                    'average_score': data['score_sum'] / data['count'] if data['count'] else 0
+                }
+
+            return {
+                'total_leads': total,
+                'average_score': summary['score_sum'] / total if total else 0,
+                'score_distribution': {int(score): count for score, count in summary['by_score'].items()},
+                'by_pipeline': by_pipeline,
+                'by_status': dict(summary['by_status']),
+                'high_score_count': len(summary['high_score_ids'])
+            }
+
+    def get_high_score_leads(self) -> List[Dict]:
+        """Stored entries of leads at or above the high-score threshold"""
+        with self._lock:
+            self.refresh()
+            return [
+                dict(self.scores[lead_id], id=lead_id)
+                for lead_id in self.summary['high_score_ids']
+                if lead_id in self.scores
+            ]
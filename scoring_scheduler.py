@@ -0,0 +1,233 @@
+import time
+from typing import Callable, Dict, List, Optional
+from resilience import CLOSED
+
+# gpt-4o-mini pricing, USD per token
+INPUT_PRICE_PER_TOKEN = 0.15 / 1_000_000
+OUTPUT_PRICE_PER_TOKEN = 0.60 / 1_000_000
+
+# Scoring prompt template + system message, and the max_tokens of a reply
+PROMPT_OVERHEAD_TOKENS = 350
+MAX_OUTPUT_TOKENS = 150
+# Score-only replies are capped at a few tokens; reasons cost about this much
+SCORE_ONLY_OUTPUT_TOKENS = 3
+REASON_OUTPUT_TOKENS = 100
+
+DEFAULT_PRIORITY = ['unscored', 'pipelines', 'recent', 'price']
+
+# Rewriting the score store after every chunk is quadratic on large accounts
+SAVE_INTERVAL = 30  # seconds
+
+# Give up after waiting out this many open circuits without a successful chunk
+MAX_CIRCUIT_WAITS = 10
+
+
+def _pipeline_id(lead: Dict):
+    pipeline = lead.get('pipeline') if isinstance(lead.get('pipeline'), dict) else {}
+    return lead.get('pipeline_id') or pipeline.get('id')
+
+
+class ScoringScheduler:
+    """Score the most valuable leads first within a token/dollar budget and a deadline.
+
+    Leads are ordered by the configured priority rules (earlier rules win) and
+    scored in small concurrent chunks. Before each chunk the remaining budget
+    is checked against an estimated per-lead cost, so a run stops cleanly
+    instead of overshooting, and reports which leads are still pending.
+    Leads that fail to score are parked on the scorer. While the OpenAI
+    circuit breaker is open the run waits for its reset timeout and then
+    sends a single lead as the half-open trial.
+    """
+
+    def __init__(self, ai_scorer, score_store=None, budget_tokens: Optional[int] = None,
+                 budget_usd: Optional[float] = None, deadline_seconds: Optional[float] = None,
+                 priority: Optional[List[str]] = None, preferred_pipelines: Optional[List[int]] = None,
+                 dedupe_threshold: Optional[float] = None, score_only: bool = False,
+                 reason_threshold: Optional[int] = None):
+        self.ai_scorer = ai_scorer
+        self.score_store = score_store
+        self.budget_tokens = budget_tokens
+        self.budget_usd = budget_usd
+        self.deadline_seconds = deadline_seconds
+        self.priority = priority or DEFAULT_PRIORITY
+        self.preferred_pipelines = list(preferred_pipelines or [])
+        if dedupe_threshold is None:
+            dedupe_threshold = ai_scorer.dedupe_threshold
+        self.dedupe_threshold = dedupe_threshold
+        # Score-only mode skips reasons, except for leads at or above reason_threshold
+        self.score_only = score_only
+        self.reason_threshold = reason_threshold
+
+        self.rules: Dict[str, Callable[[Dict], object]] = {
+            'unscored': self._unscored_first,
+            'pipelines': self._preferred_pipeline_first,
+            'recent': lambda lead: -(lead.get('updated_at') or 0),
+            'price': lambda lead: -(lead.get('price') or 0)
+        }
+        unknown = [rule for rule in self.priority if rule not in self.rules]
+        if unknown:
+            raise ValueError(f"Unknown priority rules: {', '.join(unknown)}")
+
+    def _unscored_first(self, lead: Dict) -> int:
+        if self.score_store is None:
+            return 0
+        return 0 if self.score_store.resolve_score(lead) is None else 1
+
+    def _preferred_pipeline_first(self, lead: Dict) -> int:
+        pipeline_id = _pipeline_id(lead)
+        if pipeline_id in self.preferred_pipelines:
+            return self.preferred_pipelines.index(pipeline_id)
+        return len(self.preferred_pipelines)
+
+    def order(self, leads: List[Dict]) -> List[Dict]:
+        """Sort leads by priority (stable for ties)"""
+        rules = [self.rules[name] for name in self.priority]
+        return sorted(leads, key=lambda lead: tuple(rule(lead) for rule in rules))
+
+    @staticmethod
+    def cost_usd(prompt_tokens: int, completion_tokens: int) -> float:
+        return prompt_tokens * INPUT_PRICE_PER_TOKEN + completion_tokens * OUTPUT_PRICE_PER_TOKEN
+
+    def _estimate(self, lead: Dict, spent: Dict) -> tuple:
+        """Estimated (prompt, completion) tokens for scoring one lead"""
+        if spent['leads']:
+            # Calibrate from what this run has actually used per lead so far;
+            # a lead may take several requests (score, reason, hedges)
+            return (spent['prompt_tokens'] / spent['leads'] * 1.2,
+                    spent['completion_tokens'] / spent['leads'] * 1.2)
+        prompt_tokens = len(self.ai_scorer.extract_lead_data(lead)) / 4 + PROMPT_OVERHEAD_TOKENS
+        if not self.score_only:
+            return prompt_tokens, MAX_OUTPUT_TOKENS
+        if self.reason_threshold is None:
+            return prompt_tokens, SCORE_ONLY_OUTPUT_TOKENS
+        # Assume the lead may need a reason call as well
+        return prompt_tokens * 2, SCORE_ONLY_OUTPUT_TOKENS + REASON_OUTPUT_TOKENS
+
+    def _fits(self, spent: Dict, planned: tuple) -> bool:
+        prompt_tokens = spent['prompt_tokens'] + planned[0]
+        completion_tokens = spent['completion_tokens'] + planned[1]
+        if self.budget_tokens is not None and prompt_tokens + completion_tokens > self.budget_tokens:
+            return False
+        if self.budget_usd is not None and self.cost_usd(prompt_tokens, completion_tokens) > self.budget_usd:
+            return False
+        return True
+
+    def run(self, leads: List[Dict], max_leads: Optional[int] = None,
+            on_chunk: Optional[Callable[[List[Dict]], None]] = None) -> Dict:
+        """Score leads in priority order until done, out of budget or past the deadline.
+
+        on_chunk, if given, receives each chunk of scored leads as soon as it
+        is done (used to stream results).
+        """
+        started = time.monotonic()
+        usage_before = self.ai_scorer.get_usage()
+        ordered = self.order(leads)
+        if max_leads is not None:
+            ordered = ordered[:max_leads]
+
+        # Queue of (lead, near-duplicates sharing its score). Budget is only
+        # spent on the first member of each cluster in priority order.
+        if self.dedupe_threshold is not None and len(ordered) > 1:
+            representatives = self.ai_scorer.cluster_duplicates(ordered, self.dedupe_threshold)
+            members = {i: [] for i in set(representatives)}
+            for i, representative in enumerate(representatives):
+                if representative != i:
+                    members[representative].append(ordered[i])
+            pending = [(ordered[i], members[i]) for i in sorted(members)]
+        else:
+            pending = [(lead, []) for lead in ordered]
+
+        scored_leads = []
+        parked_leads = []
+        stop_reason = 'completed'
+        last_save = started
+        attempted = 0
+        circuit_waits = 0
+
+        while pending:
+            if self.deadline_seconds is not None and time.monotonic() - started >= self.deadline_seconds:
+                stop_reason = 'deadline'
+                break
+            breaker = self.ai_scorer.breaker
+            retry_in = breaker.retry_in()
+            if retry_in:
+                if circuit_waits >= MAX_CIRCUIT_WAITS:
+                    stop_reason = 'circuit_open'
+                    break
+                if self.deadline_seconds is not None and time.monotonic() - started + retry_in >= self.deadline_seconds:
+                    stop_reason = 'deadline'
+                    break
+                print(f"OpenAI circuit is open; waiting {retry_in:.0f}s before a trial request")
+                time.sleep(retry_in)
+                circuit_waits += 1
+                continue
+
+            usage = self.ai_scorer.get_usage()
+            spent = {key: usage[key] - usage_before[key] for key in usage}
+            spent['leads'] = attempted
+
+            # Take as many leads as the remaining budget allows, up to the
+            # current concurrency limit so the deadline is checked often
+            chunk_size = max(1, int(self.ai_scorer.limiter.limit))
+            if breaker.state != CLOSED:
+                # Half-open: only one trial request is let through
+                chunk_size = 1
+            chunk = []
+            planned = (0, 0)
+            for lead, _ in pending[:chunk_size]:
+                estimate = self._estimate(lead, spent)
+                next_planned = (planned[0] + estimate[0], planned[1] + estimate[1])
+                if not self._fits(spent, next_planned):
+                    break
+                chunk.append(lead)
+                planned = next_planned
+
+            if not chunk:
+                stop_reason = 'budget'
+                break
+
+            results = self.ai_scorer.batch_score_leads(
+                chunk, with_reasons=not self.score_only, reason_threshold=self.reason_threshold
+            )
+            attempted += len(chunk)
+            if results:
+                circuit_waits = 0
+
+            # Failed leads are missing from the results (parked on the scorer)
+            results_by_id = {result.get('id'): result for result in results}
+            for lead, duplicates in pending[:len(chunk)]:
+                result = results_by_id.get(lead.get('id'))
+                if result is None:
+                    for member in duplicates:
+                        self.ai_scorer.park_lead(member)
+                    parked_leads.extend([lead] + duplicates)
+                    continue
+                results.extend(self.ai_scorer.copy_duplicate_score(member, result) for member in duplicates)
+            if self.score_store is not None:
+                self.score_store.record_scored_leads(results, save=False)
+                if time.monotonic() - last_save >= SAVE_INTERVAL:
+                    self.score_store.save()
+                    last_save = time.monotonic()
+            scored_leads.extend(results)
+            if on_chunk is not None:
+                on_chunk(results)
+            pending = pending[len(chunk):]
+
+        if self.score_store is not None and scored_leads:
+            self.score_store.save()
+
+        usage = self.ai_scorer.get_usage()
+        prompt_tokens = usage['prompt_tokens'] - usage_before['prompt_tokens']
+        completion_tokens = usage['completion_tokens'] - usage_before['completion_tokens']
+        pending_leads = [lead for representative, duplicates in pending for lead in [representative] + duplicates]
+
+        return {
+            "scored_leads": scored_leads,
+            "pending_leads": pending_leads,
+            "pending_count": len(pending_leads),
+            "parked_leads": parked_leads,
+            "stop_reason": stop_reason,
+            "spent_tokens": prompt_tokens + completion_tokens,
+            "spent_usd": self.cost_usd(prompt_tokens, completion_tokens),
+            "elapsed_seconds": time.monotonic() - started
+        }
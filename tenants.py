@@ -0,0 +1,197 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from lead_processor import LeadProcessor
+
+DEFAULT_ACCOUNTS_DIR = "accounts"
+DEFAULT_CHUNK_SIZE = 25
+# Score/results stores are written at most this often, and once per account at the end
+FLUSH_INTERVAL = 30  # seconds
+
+
+class Account:
+    """Credentials and storage location of one Kommo account"""
+
+    def __init__(self, name: str, kommo_base_url: str, kommo_api_key: str,
+                 openai_api_key: Optional[str] = None, data_dir: str = DEFAULT_ACCOUNTS_DIR):
+        self.name = name
+        self.kommo_base_url = kommo_base_url
+        self.kommo_api_key = kommo_api_key
+        self.openai_api_key = openai_api_key
+        self.data_dir = os.path.join(data_dir, name)
+
+    def create_processor(self) -> LeadProcessor:
+        """LeadProcessor with this account's credentials and its own score/results stores"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        return LeadProcessor(
+            store_path=os.path.join(self.data_dir, "lead_scores.json"),
+            results_path=os.path.join(self.data_dir, "scored_results.arrow"),
+            kommo_base_url=self.kommo_base_url,
+            kommo_api_key=self.kommo_api_key,
+            openai_api_key=self.openai_api_key
+        )
+
+
+def load_accounts(path: str, data_dir: str = DEFAULT_ACCOUNTS_DIR) -> List[Account]:
+    """Read accounts from a JSON list of {name, kommo_base_url, kommo_api_key[, openai_api_key]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    names = [entry['name'] for entry in entries]
+    if len(set(names)) != len(names):
+        raise ValueError("Account names must be unique")
+
+    for entry in entries:
+        # An empty value would fall back to the default account's credentials
+        missing = [field for field in ('kommo_base_url', 'kommo_api_key') if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Account '{entry['name']}' is missing {', '.join(missing)}")
+
+    return [
+        Account(entry['name'], entry['kommo_base_url'], entry['kommo_api_key'],
+                entry.get('openai_api_key') or None, data_dir)
+        for entry in entries
+    ]
+
+
+class MultiTenantRunner:
+    """Score leads of several Kommo accounts concurrently with fair scheduling.
+
+    Each account gets its own LeadProcessor, so its Kommo limiter, contact
+    cache and score stores are never shared; OpenAI limits are shared only by
+    accounts that use the same OpenAI key. An account's work is
+    split into tasks (fetch its leads, score chunks of them, then flush its
+    stores; chunks also flush every FLUSH_INTERVAL seconds); the
+    dispatcher hands out tasks round-robin across accounts and keeps at most
+    one task per account in flight, so a huge account cannot starve small
+    ones while every account keeps its own limiters busy.
+    """
+
+    def __init__(self, accounts: List[Account], max_workers: int = 8, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.accounts = {account.name: account for account in accounts}
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.processors: Dict[str, LeadProcessor] = {}
+
+    def processor(self, name: str) -> LeadProcessor:
+        """The account's processor (created once, reused across runs)"""
+        if name not in self.processors:
+            self.processors[name] = self.accounts[name].create_processor()
+        return self.processors[name]
+
+    def _fetch(self, name: str, stats: Dict, max_leads: Optional[int], tag: bool) -> List[tuple]:
+        leads = self.processor(name).kommo_client.get_all_leads()
+        if max_leads is not None:
+            leads = leads[:max_leads]
+        stats['total_leads'] = len(leads)
+        print(f"[{name}] {len(leads)} leads to process")
+
+        tasks = [
+            ('score', leads[start:start + self.chunk_size], tag)
+            for start in range(0, len(leads), self.chunk_size)
+        ]
+        return tasks + [('flush',)] if tasks else []
+
+    def _score(self, name: str, stats: Dict, leads: List[Dict], tag: bool) -> List[tuple]:
+        processor = self.processor(name)
+        # Stores are written by the account's flush tasks, not per chunk
+        scored_leads = processor.resolve_scores(leads, rescore=True, save=False)
+        stats['scored_leads'] += len(scored_leads)
+        stats['high_score_count'] += len([lead for lead in scored_leads if lead.get('ai_score', 0) >= 5])
+        if tag:
+            stats['tagged_leads'] += processor.tag_leads(scored_leads, save=False)
+        stats['chunks'] += 1
+        stats['parked_leads'] = len(processor.ai_scorer.parked_leads)
+
+        if time.monotonic() - stats['last_flush'] >= FLUSH_INTERVAL:
+            self._flush(name, stats)
+        return []
+
+    def _flush(self, name: str, stats: Dict):
+        self.processor(name).flush()
+        stats['last_flush'] = time.monotonic()
+
+    def _run_task(self, name: str, stats: Dict, task: tuple, max_leads: Optional[int]) -> List[tuple]:
+        if stats['started_at'] is None:
+            stats['started_at'] = time.monotonic()
+        try:
+            if task[0] == 'fetch':
+                return self._fetch(name, stats, max_leads, task[1])
+            if task[0] == 'flush':
+                self._flush(name, stats)
+                return []
+            return self._score(name, stats, task[1], task[2])
+        finally:
+            stats['finished_at'] = time.monotonic()
+
+    def run(self, max_leads_per_account: Optional[int] = None, tag: bool = False) -> Dict:
+        """Fetch, score (and optionally tag) leads of every account"""
+        started = time.monotonic()
+        names = list(self.accounts)
+        queues = {name: deque([('fetch', tag)]) for name in names}
+        stats = {
+            name: {
+                'total_leads': 0, 'scored_leads': 0, 'high_score_count': 0, 'tagged_leads': 0,
+                'chunks': 0, 'parked_leads': 0, 'errors': [], 'started_at': None, 'finished_at': None,
+                'last_flush': time.monotonic()
+            }
+            for name in names
+        }
+
+        turn = deque(names)
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # One pass over the accounts, starting after the last one served
+                busy = set(in_flight.values())
+                for _ in range(len(turn)):
+                    if len(in_flight) >= self.max_workers:
+                        break
+                    name = turn[0]
+                    turn.rotate(-1)
+                    if name in busy or not queues[name]:
+                        continue
+                    task = queues[name].popleft()
+                    future = executor.submit(self._run_task, name, stats[name], task, max_leads_per_account)
+                    in_flight[future] = name
+                    busy.add(name)
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    try:
+                        queues[name].extend(future.result())
+                    except Exception as e:
+                        print(f"[{name}] Task failed: {e}")
+                        stats[name]['errors'].append(str(e))
+
+        accounts = {}
+        for name, account_stats in stats.items():
+            started_at = account_stats.pop('started_at')
+            finished_at = account_stats.pop('finished_at')
+            account_stats.pop('last_flush')
+            account_stats['elapsed_seconds'] = finished_at - started_at if started_at is not None else 0
+            accounts[name] = account_stats
+
+        return {
+            "accounts": accounts,
+            "total_scored": sum(account['scored_leads'] for account in accounts.values()),
+            "elapsed_seconds": time.monotonic() - started
+        }
+
+    def close(self):
+        """Close every account's processor"""
+        for processor in self.processors.values():
+            processor.close()
+        self.processors = {}
+
+    def get_concurrency_stats(self) -> Dict:
+        """Adaptive concurrency limits per account"""
+        return {name: processor.get_concurrency_stats() for name, processor in self.processors.items()}
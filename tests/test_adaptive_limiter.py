@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+import adaptive_limiter
+from adaptive_limiter import THROTTLED, TIMEOUT, AdaptiveLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(adaptive_limiter, 'time', clock)
+    return clock
+
+
+def _request(limiter, clock, latency, outcome=adaptive_limiter.OK):
+    started = limiter.acquire()
+    clock.now += latency
+    limiter.release(started, outcome)
+
+
+def test_limit_grows_while_latency_is_steady(clock):
+    limiter = AdaptiveLimiter('test', initial_limit=4, max_limit=6)
+    for _ in range(50):
+        _request(limiter, clock, 0.1)
+
+    stats = limiter.stats()
+    assert stats['limit'] == 6
+    assert stats['completed'] == 50
+    assert stats['decreases'] == 0
+
+
+def test_throttling_and_timeouts_back_off(clock):
+    limiter = AdaptiveLimiter('test', initial_limit=8, min_limit=2)
+    _request(limiter, clock, 0.1)
+    _request(limiter, clock, 0.1, THROTTLED)
+    assert limiter.stats()['limit'] == 4
+
+    clock.now += 1
+    _request(limiter, clock, 0.1, TIMEOUT)
+    clock.now += 1
+    _request(limiter, clock, 0.1, THROTTLED)
+
+    stats = limiter.stats()
+    assert stats['limit'] == 2
+    assert stats['throttled'] == 2
+    assert stats['timeouts'] == 1
+
+
+def test_backs_off_once_per_round_trip(clock):
+    limiter = AdaptiveLimiter('test', initial_limit=8)
+    _request(limiter, clock, 1.0)
+    # Both were in flight when the upstream started throttling
+    _request(limiter, clock, 0.1, THROTTLED)
+    _request(limiter, clock, 0.1, THROTTLED)
+
+    assert limiter.stats()['decreases'] == 1
+
+
+def test_latency_spike_backs_off(clock):
+    limiter = AdaptiveLimiter('test', initial_limit=8)
+    for _ in range(5):
+        _request(limiter, clock, 0.1)
+    before = limiter.limit
+
+    _request(limiter, clock, 1.0)
+    assert limiter.limit < before
+
+
+def test_errors_are_not_a_capacity_signal(clock):
+    limiter = AdaptiveLimiter('test', initial_limit=4)
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError("bad reply")
+
+    stats = limiter.stats()
+    assert stats['errors'] == 1
+    assert stats['limit'] == 4
+    assert stats['in_flight'] == 0
+
+
+def test_slot_reports_outcome(clock):
+    limiter = AdaptiveLimiter('test', initial_limit=4)
+    with pytest.raises(RuntimeError):
+        with limiter.slot() as slot:
+            slot.outcome = THROTTLED
+            raise RuntimeError("429")
+
+    assert limiter.stats()['throttled'] == 1
+
+
+def test_acquire_blocks_at_the_limit():
+    limiter = AdaptiveLimiter('test', initial_limit=1)
+    started = limiter.acquire()
+    acquired = threading.Event()
+
+    def second():
+        limiter.release(limiter.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    limiter.release(started)
+    assert acquired.wait(1)
+    thread.join()
@@ -0,0 +1,160 @@
+import pytest
+import requests
+
+import contact_enricher
+from contact_enricher import ContactCache, ContactEnricher
+
+
+def _contact(contact_id, phone='', email='', company_id=None, updated_at=100):
+    fields = []
+    if phone:
+        fields.append({'field_code': 'PHONE', 'values': [{'value': phone}]})
+    if email:
+        fields.append({'field_code': 'EMAIL', 'values': [{'value': email}]})
+    contact = {'id': contact_id, 'updated_at': updated_at, 'custom_fields_values': fields}
+    if company_id:
+        contact['_embedded'] = {'companies': [{'id': company_id}]}
+    return contact
+
+
+def _lead(lead_id, contact_ids=(), company_id=None):
+    embedded = {'contacts': [{'id': contact_id, 'is_main': i == 0} for i, contact_id in enumerate(contact_ids)]}
+    if company_id:
+        embedded['companies'] = [{'id': company_id}]
+    return {'id': lead_id, '_embedded': embedded}
+
+
+class FakeKommo:
+    """Serves contacts/companies by ID and records the requests made"""
+
+    def __init__(self, contacts=(), companies=()):
+        self.entities = {
+            'contacts': {contact['id']: contact for contact in contacts},
+            'companies': {company['id']: company for company in companies}
+        }
+        self.calls = []
+        self.updated = {'contacts': [], 'companies': []}
+        self.fail_updates = False
+
+    def get_contacts_by_ids(self, ids):
+        self.calls.append(('contacts', sorted(ids)))
+        return [self.entities['contacts'][i] for i in ids if i in self.entities['contacts']]
+
+    def get_companies_by_ids(self, ids):
+        self.calls.append(('companies', sorted(ids)))
+        return [self.entities['companies'][i] for i in ids if i in self.entities['companies']]
+
+    def get_updated_since(self, entity, timestamp):
+        self.calls.append(('updated', entity, timestamp))
+        if self.fail_updates:
+            raise requests.exceptions.ConnectionError("Kommo is down")
+        return self.updated[entity]
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1_000_000
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(contact_enricher, 'time', clock)
+    return clock
+
+
+def test_contacts_are_fetched_in_bulk_per_page_and_cached(clock, monkeypatch):
+    monkeypatch.setattr(contact_enricher, 'ENRICH_PAGE_SIZE', 3)
+    kommo = FakeKommo(contacts=[_contact(i, phone=f'+1{i}') for i in range(1, 6)])
+    enricher = ContactEnricher(kommo)
+    leads = [_lead(100 + i, [i % 5 + 1]) for i in range(7)]
+
+    enricher.enrich(leads)
+
+    assert kommo.calls == [('contacts', [1, 2, 3]), ('contacts', [4, 5])]
+    assert [lead['phone'][0]['value'] for lead in leads] == ['+11', '+12', '+13', '+14', '+15', '+11', '+12']
+
+    enricher.enrich([_lead(200, [3])])
+    assert len(kommo.calls) == 2
+
+
+def test_company_is_resolved_through_the_main_contact(clock):
+    kommo = FakeKommo(
+        contacts=[_contact(1, email='a@acme.example', company_id=50), _contact(2)],
+        companies=[{'id': 50, 'name': 'Acme', 'updated_at': 1}, {'id': 60, 'name': 'Globex', 'updated_at': 1}]
+    )
+    leads = [_lead(1, [1, 2]), _lead(2, [1], company_id=60), _lead(3)]
+
+    ContactEnricher(kommo).enrich(leads)
+
+    assert leads[0]['company_name'] == 'Acme'
+    assert leads[0]['email'] == [{'value': 'a@acme.example'}]
+    # The lead's own company wins over the contact's
+    assert leads[1]['company_name'] == 'Globex'
+    assert 'company_name' not in leads[2]
+    assert ('companies', [50, 60]) in kommo.calls
+
+
+def test_existing_lead_fields_are_kept(clock):
+    kommo = FakeKommo(contacts=[_contact(1, phone='+100')])
+    lead = dict(_lead(1, [1]), phone=[{'value': '+999'}])
+
+    ContactEnricher(kommo).enrich([lead])
+
+    assert lead['phone'] == [{'value': '+999'}]
+
+
+def test_cache_never_replaces_a_newer_copy():
+    cache = ContactCache()
+    cache.put('contacts', [_contact(1, phone='+new', updated_at=200)])
+    cache.put('contacts', [_contact(1, phone='+old', updated_at=100)])
+    assert cache.get('contacts', 1)['updated_at'] == 200
+
+    cache.put('contacts', [_contact(1, phone='+newer', updated_at=200)])
+    assert cache.get('contacts', 1)['custom_fields_values'][0]['values'][0]['value'] == '+newer'
+
+
+def test_changed_contacts_are_refreshed_after_the_interval(clock):
+    kommo = FakeKommo(contacts=[_contact(1, phone='+old')])
+    enricher = ContactEnricher(kommo)
+    enricher.enrich([_lead(1, [1])])
+    first_sync = enricher.cache.last_sync
+
+    kommo.updated['contacts'] = [_contact(1, phone='+new', updated_at=300), _contact(9, updated_at=300)]
+    clock.now += 10
+    enricher.enrich([_lead(2, [1])])
+    assert not any(call[0] == 'updated' for call in kommo.calls)
+
+    clock.now += contact_enricher.REFRESH_INTERVAL
+    lead = _lead(3, [1])
+    enricher.enrich([lead])
+
+    assert ('updated', 'contacts', first_sync) in kommo.calls
+    assert lead['phone'] == [{'value': '+new'}]
+    # Only contacts we already cache are refreshed
+    assert enricher.cache.get('contacts', 9) is None
+    assert enricher.cache.last_sync == clock.now
+
+
+def test_failed_sync_keeps_the_window(clock):
+    kommo = FakeKommo(contacts=[_contact(1, phone='+old')])
+    enricher = ContactEnricher(kommo)
+    enricher.enrich([_lead(1, [1])])
+    first_sync = enricher.cache.last_sync
+
+    kommo.fail_updates = True
+    clock.now += contact_enricher.REFRESH_INTERVAL
+    enricher.enrich([_lead(2, [1])])
+    assert enricher.cache.last_sync == first_sync
+
+    kommo.fail_updates = False
+    kommo.updated['contacts'] = [_contact(1, phone='+new', updated_at=300)]
+    clock.now += 1
+    lead = _lead(3, [1])
+    enricher.enrich([lead])
+
+    assert [call for call in kommo.calls if call[0] == 'updated'][-1] == ('updated', 'contacts', first_sync)
+    assert lead['phone'] == [{'value': '+new'}]
@@ -0,0 +1,59 @@
+import pytest
+
+from lead_dedup import LeadDeduplicator
+
+LEAD = """Lead Information:
+- Name: Website request from Acme
+- Price: 5000
+- Created: {created}
+- Updated: {updated}
+- Contact: John Smith, Acme Corp, john@acme.example
+- Note: interested in the yearly plan for 40 seats, asked for a demo next week
+"""
+
+
+def _lead_text(created='2024-01-01', updated='2024-01-02', **replacements):
+    text = LEAD.format(created=created, updated=updated)
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+    return text
+
+
+def test_identical_leads_differing_only_in_timestamps_cluster():
+    texts = [
+        _lead_text(),
+        _lead_text(created='2024-03-05', updated='2024-03-06'),
+        _lead_text(created='2024-05-01', updated='2024-05-09')
+    ]
+
+    assert LeadDeduplicator().cluster(texts) == [0, 0, 0]
+
+
+def test_different_leads_get_their_own_cluster():
+    texts = [
+        _lead_text(),
+        "Lead Information:\n- Name: Partnership inquiry\n- Contact: Maria Garcia, Globex\n- Note: reseller in Spain",
+        _lead_text(),
+        "Lead Information:\n- Name: Support question\n- Note: password reset does not arrive"
+    ]
+
+    assert LeadDeduplicator().cluster(texts) == [0, 1, 0, 3]
+
+
+def test_threshold_controls_how_close_duplicates_must_be():
+    texts = [_lead_text(), _lead_text(Acme='Initech')]
+    dedup = LeadDeduplicator()
+    similarity = dedup.similarity(dedup.signature(texts[0]), dedup.signature(texts[1]))
+    assert 0.3 < similarity < 1
+
+    assert LeadDeduplicator(threshold=1.0).cluster(texts) == [0, 1]
+    assert LeadDeduplicator(threshold=0.3).cluster(texts) == [0, 0]
+
+
+def test_signatures_are_deterministic():
+    assert LeadDeduplicator().signature(_lead_text()) == LeadDeduplicator().signature(_lead_text())
+
+
+def test_bands_must_divide_permutations():
+    with pytest.raises(ValueError):
+        LeadDeduplicator(num_perm=64, bands=10)
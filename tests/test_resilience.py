@@ -0,0 +1,217 @@
+import threading
+import time
+
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, HedgedCaller, LatencyTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    return clock
+
+
+def test_latency_percentile_needs_enough_samples():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for i in range(9):
+        tracker.record(i / 10)
+    assert tracker.percentile(95) is None
+
+    for i in range(9, 100):
+        tracker.record(i / 10)
+    assert tracker.percentile(50) == 5.0
+    assert tracker.percentile(95) == 9.5
+    assert tracker.percentile(100) == 9.9
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.is_open()
+    assert breaker.retry_in() == 30
+
+    clock.now += 10
+    assert breaker.retry_in() == 20
+    assert breaker.stats()['rejected'] == 1
+    assert breaker.stats()['opens'] == 1
+
+
+def test_breaker_lets_one_trial_through_after_reset_timeout(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+
+    clock.now += 30
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only the trial call goes through until it reports back
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    breaker = CircuitBreaker('test', failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == 30
+    assert breaker.stats()['opens'] == 2
+
+
+def _tracker(latency: float) -> LatencyTracker:
+    tracker = LatencyTracker(min_samples=20)
+    for _ in range(20):
+        tracker.record(latency)
+    return tracker
+
+
+def _request(primary_delay: float, queue_delay: float = 0.0, sent=None):
+    """func(hedge, on_start) whose primary is slow and whose hedge is fast"""
+    def func(hedge, on_start):
+        if not hedge:
+            time.sleep(queue_delay)
+        on_start()
+        if sent is not None:
+            sent.append('hedge' if hedge else 'primary')
+        if not hedge:
+            time.sleep(primary_delay)
+            return 'primary'
+        return 'hedge'
+    return func
+
+
+def test_no_hedge_without_latency_history():
+    hedger = HedgedCaller('test', max_hedge_ratio=1.0)
+    try:
+        assert hedger.call(_request(0.05)) == 'primary'
+        assert hedger.stats()['hedges_issued'] == 0
+        assert hedger.latency.percentile(95) is None
+    finally:
+        hedger.close()
+
+
+def test_slow_primary_is_hedged():
+    hedger = HedgedCaller('test', max_hedge_ratio=1.0, latency=_tracker(0.01))
+    try:
+        assert hedger.call(_request(0.5)) == 'hedge'
+        stats = hedger.stats()
+        assert stats['hedges_issued'] == 1
+        assert stats['hedges_won'] == 1
+    finally:
+        hedger.close()
+
+
+def test_hedges_are_capped():
+    hedger = HedgedCaller('test', max_hedge_ratio=0.1, latency=_tracker(0.01))
+    try:
+        assert hedger.call(_request(0.1)) == 'primary'
+        assert hedger.stats()['hedges_issued'] == 0
+    finally:
+        hedger.close()
+
+
+def test_queueing_before_the_request_is_not_latency():
+    hedger = HedgedCaller('test', max_hedge_ratio=1.0, latency=_tracker(0.05))
+    try:
+        # Waits 0.2s (e.g. for a limiter slot), then the request itself is quick
+        assert hedger.call(_request(0.01, queue_delay=0.2)) == 'primary'
+        assert hedger.stats()['hedges_issued'] == 0
+        assert hedger.latency.percentile(100) < 0.2
+    finally:
+        hedger.close()
+
+
+def test_losing_attempt_that_has_not_started_is_not_sent():
+    hedger = HedgedCaller('test', max_hedge_ratio=1.0, latency=_tracker(0.01))
+    sent = []
+    gate = threading.Event()
+    hedge_done = threading.Event()
+
+    def func(hedge, on_start):
+        if hedge:
+            # Hedge is held up until the primary has already won
+            gate.wait()
+            try:
+                on_start()
+                sent.append('hedge')
+            finally:
+                hedge_done.set()
+            return 'hedge'
+        on_start()
+        sent.append('primary')
+        time.sleep(0.1)
+        return 'primary'
+
+    try:
+        assert hedger.call(func) == 'primary'
+        gate.set()
+        assert hedge_done.wait(1)
+        assert sent == ['primary']
+    finally:
+        hedger.close()
+
+
+def test_error_is_raised_when_every_attempt_fails():
+    hedger = HedgedCaller('test', max_hedge_ratio=1.0, latency=_tracker(0.01))
+
+    def func(hedge, on_start):
+        on_start()
+        time.sleep(0.05)
+        raise ConnectionError('hedge' if hedge else 'primary')
+
+    try:
+        with pytest.raises(ConnectionError):
+            hedger.call(func)
+        assert hedger.stats()['hedges_issued'] == 1
+        assert hedger.stats()['hedges_won'] == 0
+    finally:
+        hedger.close()
+
+
+def test_close_stops_the_executor():
+    hedger = HedgedCaller('test')
+    hedger.close()
+
+    with pytest.raises(RuntimeError):
+        hedger.call(_request(0))
+
+
+
+def test_hedges_do_not_queue_behind_primaries():
+    # The only call worker is busy with the slow primary; the hedge has its own pool
+    hedger = HedgedCaller('test', max_workers=1, hedge_workers=1, max_hedge_ratio=1.0,
+                          latency=_tracker(0.01))
+    try:
+        started = time.monotonic()
+        assert hedger.call(_request(0.5)) == 'hedge'
+        assert time.monotonic() - started < 0.4
+    finally:
+        hedger.close()
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+import results_store
+from results_store import ResultsStore
+
+
+def _lead(lead_id, score, pipeline_id=1, status_id=10, price=0):
+    return {'id': lead_id, 'name': f'Lead {lead_id}', 'ai_score': score, 'ai_reason': None,
+            'pipeline_id': pipeline_id, 'status_id': status_id, 'price': price}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultsStore(str(tmp_path / "scored_results.arrow"))
+
+
+def _scores(store):
+    return {row['id']: row['ai_score'] for row in store.table().to_pylist()}
+
+
+def test_write_appends_a_part_per_call(store):
+    store.write([_lead(1, 3), _lead(2, 7)])
+    store.write([_lead(3, 5)])
+
+    assert len(store._part_paths()) == 2
+    assert not os.path.exists(store.path)
+    assert _scores(store) == {1: 3, 2: 7, 3: 5}
+
+
+def test_latest_row_per_lead_wins(store):
+    store.write([_lead(1, 3), _lead(2, 7)])
+    store.write([_lead(1, 9)])
+    store.write([_lead(2, 4), _lead(1, 6)])
+
+    assert store.table().num_rows == 2
+    assert _scores(store) == {1: 6, 2: 4}
+
+
+def test_parts_are_compacted_at_max_parts(store, monkeypatch):
+    monkeypatch.setattr(results_store, 'MAX_PARTS', 4)
+    for i in range(3):
+        store.write([_lead(1, i), _lead(10 + i, 5)])
+    assert len(store._part_paths()) == 3
+
+    store.write([_lead(1, 8)])
+
+    assert store._part_paths() == []
+    assert os.path.exists(store.path)
+    assert _scores(ResultsStore(store.path)) == {1: 8, 10: 5, 11: 5, 12: 5}
+
+    # Later parts still override the compacted main file
+    store.write([_lead(10, 2)])
+    assert _scores(store) == {1: 8, 10: 2, 11: 5, 12: 5}
+
+
+def test_compaction_keeps_parts_written_after_the_table_was_read(store):
+    store.write([_lead(1, 3)])
+    store.write([_lead(2, 4)])
+    table = store.table()
+
+    # Another process appends while we are about to rewrite the main file
+    ResultsStore(store.path).write([_lead(3, 9)])
+    store._replace(table)
+
+    assert len(store._part_paths()) == 1
+    assert _scores(store) == {1: 3, 2: 4, 3: 9}
+
+
+def test_record_moves_and_reason(store):
+    store.write([_lead(1, 7, pipeline_id=1, status_id=10), _lead(2, 3, pipeline_id=1, status_id=10)])
+    store.write([_lead(3, 8, pipeline_id=2, status_id=20)])
+
+    store.record_moves([1, 3], pipeline_id=5, status_id=50)
+    store.record_reason(2, 'Cold lead')
+
+    rows = {row['id']: row for row in store.table().to_pylist()}
+    assert (rows[1]['pipeline_id'], rows[1]['status_id']) == (5, 50)
+    assert (rows[2]['pipeline_id'], rows[2]['ai_reason']) == (1, 'Cold lead')
+    assert (rows[3]['pipeline_id'], rows[3]['status_id']) == (5, 50)
+    assert store._part_paths() == []
+
+
+def test_query_filters_sorts_and_pages(store):
+    store.write([_lead(i, i % 10 + 1, pipeline_id=1 if i % 2 else 2, price=i) for i in range(1, 31)])
+
+    rows, total = store.query(min_score=5, pipeline_ids=[1], sort_by='price', descending=True,
+                              page=2, page_size=5)
+    matching = sorted((i for i in range(1, 31) if i % 2 and i % 10 + 1 >= 5), reverse=True)
+    assert total == len(matching)
+    assert [row['id'] for row in rows] == matching[5:10]
+    assert store.count(min_score=5, pipeline_ids=[1]) == total
+    assert store.distinct('pipeline_id') == [1, 2]
@@ -0,0 +1,147 @@
+import threading
+
+from score_store import ScoreStore, score_from_tags
+
+
+def _lead(lead_id, updated_at=100, tags=None, pipeline_id=1, status_id=10):
+    return {
+        'id': lead_id,
+        'updated_at': updated_at,
+        'pipeline_id': pipeline_id,
+        'status_id': status_id,
+        '_embedded': {'tags': [{'name': name} for name in (tags or [])]}
+    }
+
+
+def _store(tmp_path):
+    return ScoreStore(str(tmp_path / "lead_scores.json"))
+
+
+def test_score_from_tags():
+    assert score_from_tags(_lead(1, tags=['VIP', 'AI_Score_7'])) == 7
+    assert score_from_tags(_lead(1, tags=['VIP'])) is None
+    assert score_from_tags({'id': 1}) is None
+
+
+def test_score_from_tags_with_several_scores_is_unknown():
+    assert score_from_tags(_lead(1, tags=['AI_Score_3', 'AI_Score_8'])) is None
+
+
+def test_resolve_score_prefers_fresh_stored_score(tmp_path):
+    store = _store(tmp_path)
+    store.record(_lead(1, updated_at=100), 6)
+
+    assert store.resolve_score(_lead(1, updated_at=100, tags=['AI_Score_2'])) == 6
+    # Updated in Kommo since it was scored: needs re-scoring, stale tag is ignored
+    assert store.resolve_score(_lead(1, updated_at=200, tags=['AI_Score_2'])) is None
+    # Never stored: fall back to the tag
+    assert store.resolve_score(_lead(2, tags=['AI_Score_4'])) == 4
+
+
+def test_touch_keeps_own_updates_fresh(tmp_path):
+    store = _store(tmp_path)
+    store.record(_lead(1, updated_at=100), 6)
+    store.touch(1, 150)
+
+    assert store.is_fresh(_lead(1, updated_at=150))
+    store.touch(1, 120)
+    assert store.get(1)['updated_at'] == 150
+
+
+def test_summary_is_maintained_incrementally(tmp_path):
+    store = _store(tmp_path)
+    store.record(_lead(1, pipeline_id=1, status_id=10), 8)
+    store.record(_lead(2, pipeline_id=1, status_id=11), 2)
+    store.record(_lead(3, pipeline_id=2, status_id=20), 5)
+    # Re-scoring and moving replace the old contribution
+    store.record(_lead(2, pipeline_id=1, status_id=11), 6)
+    store.record_move(1, 2, 20)
+
+    summary = store.get_summary()
+    assert summary['total_leads'] == 3
+    assert summary['score_distribution'] == {8: 1, 6: 1, 5: 1}
+    assert summary['by_pipeline']['1'] == {'total': 1, 'high_score': 1, 'average_score': 6}
+    assert summary['by_pipeline']['2']['total'] == 2
+    assert summary['by_status'] == {'11': 1, '20': 2}
+    assert summary['high_score_count'] == 3
+
+    incremental = store.get_summary()
+    store.rebuild_summary()
+    assert store.get_summary() == incremental
+
+
+def test_save_and_load_round_trip(tmp_path):
+    store = _store(tmp_path)
+    store.record_scored_leads([dict(_lead(1), ai_score=7, ai_reason='Budget confirmed'),
+                               dict(_lead(2), ai_score=3, ai_reason=None)])
+    store.set_reason(2, 'Cold lead')
+    store.save()
+
+    loaded = _store(tmp_path)
+    assert loaded.get(1)['reason'] == 'Budget confirmed'
+    assert loaded.get(2)['reason'] == 'Cold lead'
+    assert loaded.get_summary() == store.get_summary()
+    assert [entry['id'] for entry in loaded.get_high_score_leads()] == ['1']
+
+
+def test_load_ignores_corrupt_file(tmp_path):
+    (tmp_path / "lead_scores.json").write_text("{not json", encoding='utf-8')
+
+    store = _store(tmp_path)
+    assert store.scores == {}
+    assert store.get_summary()['total_leads'] == 0
+
+
+def test_refresh_picks_up_scores_saved_by_another_process(tmp_path):
+    app = _store(tmp_path)
+    app.record(_lead(1), 4)
+    app.save()
+
+    cron = _store(tmp_path)
+    cron.record(_lead(2), 9)
+    cron.record(_lead(1, updated_at=200), 6)
+    cron.save()
+
+    summary = app.get_summary()
+    assert summary['total_leads'] == 2
+    assert summary['score_distribution'] == {6: 1, 9: 1}
+    assert app.get(1)['score'] == 6
+
+
+def test_save_keeps_entries_saved_by_another_process(tmp_path):
+    app = _store(tmp_path)
+    cron = _store(tmp_path)
+
+    cron.record(_lead(1), 7)
+    cron.record(_lead(2), 3)
+    cron.save()
+    # The app changed lead 2 without having seen the cron run
+    app.record(_lead(2), 8)
+    app.save()
+
+    loaded = _store(tmp_path)
+    assert loaded.get(1)['score'] == 7
+    assert loaded.get(2)['score'] == 8
+    assert loaded.get_summary() == app.get_summary()
+    assert loaded.get_summary()['total_leads'] == 2
+
+
+def test_concurrent_record_and_save(tmp_path):
+    store = _store(tmp_path)
+
+    def writer(offset):
+        for i in range(300):
+            store.record(_lead(offset + i), i % 10)
+            if i % 50 == 0:
+                store.save()
+
+    threads = [threading.Thread(target=writer, args=(offset,)) for offset in (0, 1000, 2000)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.save()
+
+    loaded = _store(tmp_path)
+    assert len(loaded.scores) == 900
+    assert loaded.get_summary() == store.get_summary()
@@ -0,0 +1,177 @@
+import types
+
+import scoring_scheduler
+from lead_dedup import LeadDeduplicator
+from resilience import CircuitBreaker
+from score_store import ScoreStore
+from scoring_scheduler import ScoringScheduler
+
+PROMPT_TOKENS = 400
+COMPLETION_TOKENS = 2
+
+
+class StubScorer:
+    """Stands in for AILeadScorer: scores price // 1000 without calling OpenAI"""
+
+    dedupe_threshold = None
+
+    def __init__(self, fail_calls: int = 0, fail_ids=()):
+        self.fail_calls = fail_calls
+        self.fail_ids = set(fail_ids)
+        self.breaker = CircuitBreaker('openai', failure_threshold=2, reset_timeout=0.01)
+        self.limiter = types.SimpleNamespace(limit=4)
+        self.usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+        self.chunks = []
+        self.parked_leads = {}
+
+    def get_usage(self):
+        return dict(self.usage)
+
+    def extract_lead_data(self, lead):
+        return lead['name']
+
+    def park_lead(self, lead):
+        self.parked_leads[lead['id']] = lead
+
+    def cluster_duplicates(self, leads, threshold):
+        return LeadDeduplicator(threshold).cluster([self.extract_lead_data(lead) for lead in leads])
+
+    @staticmethod
+    def copy_duplicate_score(lead, representative):
+        return dict(lead, ai_score=representative['ai_score'], ai_duplicate_of=representative['id'])
+
+    def batch_score_leads(self, leads, with_reasons=True, reason_threshold=None):
+        self.chunks.append([lead['id'] for lead in leads])
+        scored = []
+        for lead in leads:
+            if not self.breaker.allow():
+                self.park_lead(lead)
+                continue
+            if self.fail_calls or lead['id'] in self.fail_ids:
+                self.fail_calls = max(0, self.fail_calls - 1)
+                self.breaker.record_failure()
+                self.park_lead(lead)
+                continue
+            self.breaker.record_success()
+            self.usage['prompt_tokens'] += PROMPT_TOKENS
+            self.usage['completion_tokens'] += COMPLETION_TOKENS
+            scored.append(dict(lead, ai_score=lead.get('price', 0) // 1000))
+        return scored
+
+
+def _leads(count, **fields):
+    return [dict({'id': i, 'name': f'Lead {i} ' * 5, 'price': i * 1000, 'updated_at': i}, **fields)
+            for i in range(1, count + 1)]
+
+
+def test_order_applies_rules_in_priority_order(tmp_path):
+    store = ScoreStore(str(tmp_path / "scores.json"))
+    leads = [
+        {'id': 1, 'pipeline_id': 20, 'updated_at': 5},
+        {'id': 2, 'pipeline_id': 10, 'updated_at': 1},
+        {'id': 3, 'pipeline_id': 10, 'updated_at': 9},
+        {'id': 4, 'pipeline_id': 10, 'updated_at': 50}
+    ]
+    store.record(leads[3], 7)
+    scheduler = ScoringScheduler(StubScorer(), store, priority=['unscored', 'pipelines', 'recent'],
+                                 preferred_pipelines=[10])
+
+    assert [lead['id'] for lead in scheduler.order(leads)] == [3, 2, 1, 4]
+
+
+def test_unknown_priority_rule_is_rejected():
+    try:
+        ScoringScheduler(StubScorer(), priority=['price', 'size'])
+    except ValueError as e:
+        assert 'size' in str(e)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_scores_everything_without_limits():
+    scorer = StubScorer()
+    run = ScoringScheduler(scorer, score_only=True).run(_leads(10))
+
+    assert run['stop_reason'] == 'completed'
+    assert sorted(lead['id'] for lead in run['scored_leads']) == list(range(1, 11))
+    assert run['pending_count'] == 0
+    assert run['spent_tokens'] == 10 * (PROMPT_TOKENS + COMPLETION_TOKENS)
+    # Chunks follow the limiter's concurrency limit
+    assert [len(chunk) for chunk in scorer.chunks] == [4, 4, 2]
+
+
+def test_stops_before_exceeding_the_token_budget():
+    budget = 2000
+    run = ScoringScheduler(StubScorer(), score_only=True, budget_tokens=budget,
+                           priority=['price']).run(_leads(10))
+
+    assert run['stop_reason'] == 'budget'
+    assert run['spent_tokens'] <= budget
+    assert len(run['scored_leads']) == 4
+    assert run['pending_count'] == 6
+    # The most valuable leads went first
+    assert [lead['id'] for lead in run['scored_leads']] == [10, 9, 8, 7]
+
+
+def test_stops_at_the_deadline():
+    run = ScoringScheduler(StubScorer(), deadline_seconds=0).run(_leads(3))
+
+    assert run['stop_reason'] == 'deadline'
+    assert run['scored_leads'] == []
+    assert run['pending_count'] == 3
+
+
+def test_near_duplicates_share_one_request():
+    scorer = StubScorer()
+    leads = _leads(3, name='Website request from Acme, wants a demo for 40 seats next week')
+    run = ScoringScheduler(scorer, dedupe_threshold=0.9, priority=['price']).run(leads)
+
+    assert scorer.chunks == [[3]]
+    assert sorted(lead['id'] for lead in run['scored_leads']) == [1, 2, 3]
+    duplicates = [lead for lead in run['scored_leads'] if lead.get('ai_duplicate_of')]
+    assert {lead['ai_duplicate_of'] for lead in duplicates} == {3}
+    assert all(lead['ai_score'] == 3 for lead in run['scored_leads'])
+
+
+def test_failed_leads_are_parked_with_their_duplicates():
+    scorer = StubScorer(fail_ids=[3])
+    leads = _leads(3, name='Website request from Acme, wants a demo for 40 seats next week')
+    leads.append({'id': 9, 'name': 'Support question about invoices', 'price': 0, 'updated_at': 0})
+    run = ScoringScheduler(scorer, dedupe_threshold=0.9, priority=['price']).run(leads)
+
+    assert [lead['id'] for lead in run['scored_leads']] == [9]
+    assert sorted(lead['id'] for lead in run['parked_leads']) == [1, 2, 3]
+    assert sorted(scorer.parked_leads) == [1, 2, 3]
+
+
+def test_waits_for_open_circuit_and_sends_a_single_trial():
+    scorer = StubScorer(fail_calls=2)
+    run = ScoringScheduler(scorer, score_only=True).run(_leads(10))
+
+    assert run['stop_reason'] == 'completed'
+    assert scorer.breaker.state == 'closed'
+    assert sorted(lead['id'] for lead in run['parked_leads']) == [7, 8, 9, 10]
+    assert len(run['scored_leads']) == 6
+    # The first chunk opened the circuit; the next one is the half-open trial
+    assert [len(chunk) for chunk in scorer.chunks][:2] == [4, 1]
+
+
+def test_gives_up_when_the_circuit_stays_open(monkeypatch):
+    monkeypatch.setattr(scoring_scheduler, 'MAX_CIRCUIT_WAITS', 2)
+    scorer = StubScorer(fail_calls=1000)
+    run = ScoringScheduler(scorer, score_only=True).run(_leads(10))
+
+    assert run['stop_reason'] == 'circuit_open'
+    assert run['scored_leads'] == []
+    assert [len(chunk) for chunk in scorer.chunks] == [4, 1, 1]
+    assert run['pending_count'] == 4
+
+
+def test_score_store_is_saved_once_per_run(tmp_path, monkeypatch):
+    store = ScoreStore(str(tmp_path / "scores.json"))
+    saves = []
+    monkeypatch.setattr(store, 'save', lambda: saves.append(len(store.scores)))
+
+    ScoringScheduler(StubScorer(), store, score_only=True).run(_leads(10))
+
+    assert saves == [10]